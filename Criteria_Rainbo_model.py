@@ -3,42 +3,109 @@
 
 
 import numpy as np
+from collections import namedtuple
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    # pure python fallback: the kernel runs uncompiled
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
 
 RAVONE = 1
 QUADERNA = 2
 
+# creek engines
+REFERENCE = 'reference'     # scalar computeWaterLevel at each timestep
+KERNEL = 'kernel'           # soilWaterKernel over the whole series
+
+# water level methods
+LEVEL_EXACT = 'exact'       # sigmoid function (estimateLevel)
+LEVEL_TABLE = 'table'       # interpolation on a precomputed table of the sigmoid (getLevelTable)
+LEVEL_TABLE_TOLERANCE = 0.001     # [m] default maximum error of the table
+
+# table of the sigmoid function: levels [m] on a uniform swc grid [mm] from 0 to swcMax
+LevelTable = namedtuple('LevelTable', ['step', 'level', 'slope', 'zeroIdro', 'tolerance'])
+
+# compact record of the basin parameters, built once and passed in place of the basin id
+# the values of each basin are in basins.json (parameters found by fitting with observations)
+# Parameters of the sigmoid function
+#   zeroIdro        [m] minimum water level
+#   hMax            [m] maximum water level
+#   m               shape factor, computed from the reference level (see makeBasinParameters)
+#   k               factor controlling signal response (higher, increase level)
+#   swc0            [mm] swc value to be associated with the reference level
+# Infiltration limits in deep soil layer [mm/hour]
+#   infMax          mm/hour representative of very dry soil
+#   infMin          mm/hour representative of saturated soil
+# alpha: runoff decay factor, % of runoff that leaves the system in one hour
+BasinParameters = namedtuple('BasinParameters', ['zeroIdro', 'hMax', 'm', 'k', 'swc0', 'infMax', 'infMin', 'alpha'])
+
+# {month:val} maximum water storage vegetation [mm]
+VEGETATION_STORAGE = {1: 2, 2: 2, 3: 3, 4: 5, 5: 6, 6: 7, 7: 8, 8: 7, 9: 7, 10: 5, 11: 4, 12: 3}
+
+
+# Parameter record with the sigmoid parameter m computed from the reference level
+# referenceLevel: [m] water level associated with swc0 (the other arguments as in BasinParameters)
+def makeBasinParameters(zeroIdro, hMax, k, referenceLevel, swc0, infMax, infMin, alpha=0.18):
+    m = (hMax - (referenceLevel - zeroIdro)) / (referenceLevel - zeroIdro)
+    return BasinParameters(zeroIdro, hMax, m, k, swc0, infMax, infMin, alpha)
+
+
+# Parameter record of a basin: basin is a BasinParameters record, a basin name or id of basins.json
+# (the registry is loaded at the first lookup); unknown integer ids use the Ravone parameters
+def getParameters(basin):
+    if isinstance(basin, BasinParameters):
+        return basin
+    import basins
+
+    try:
+        return basins.getBasin(basin)['parameters']
+    except KeyError:
+        if isinstance(basin, (int, np.integer)):
+            return basins.getBasin(RAVONE)['parameters']
+        raise
+
 
 # Parameters of the sigmoid function found by fitting with observations
 # Ravone basin
 def getBasinParameters_Ravone():
-    zeroIdro = -0.2         # [m] minimum water level
-    hMax = 4.5              # [m] maximum water level
-    k = 0.10                # factor controlling signal response (higher, increase level)
-    referenceLevel = 1.25   # [m]
-    swc0 = 22               # [mm] swc value to be associated with the reference Level
-    m = (hMax - (referenceLevel - zeroIdro)) / (referenceLevel - zeroIdro)
-    return zeroIdro, hMax, m, k, swc0
+    return getBasinParameters(RAVONE)
 
 # Quaderna basin
 def getBasinParameters_Quaderna():
-    zeroIdro = 0.1          # [m] minimum water level
-    hMax = 2.5              # [m] maximum water level
-    k = 0.10                # factor controlling signal response (higher, increase level)
-    referenceLevel = 1.25   # [m]
-    swc0 = 16               # [mm] swc value to be associated with the reference level
-    m = (hMax - (referenceLevel - zeroIdro)) / (referenceLevel - zeroIdro)
-    return zeroIdro, hMax, m, k, swc0
+    return getBasinParameters(QUADERNA)
+
+
+# Infiltration limits in deep soil layer [mm/hour]
+def getInfiltrationParameters_Ravone():
+    return getInfiltrationParameters(RAVONE)
+
+def getInfiltrationParameters_Quaderna():
+    return getInfiltrationParameters(QUADERNA)
+
+
+# Basin parameters of the sigmoid function
+def getBasinParameters(basin):
+    parameters = getParameters(basin)
+    return parameters.zeroIdro, parameters.hMax, parameters.m, parameters.k, parameters.swc0
+
+
+# Infiltration limits in deep soil layer [mm/hour]
+def getInfiltrationParameters(basin):
+    parameters = getParameters(basin)
+    return parameters.infMax, parameters.infMin
 
 
 # Water infiltration in deep soil layer [mm/hour]
 # deficit90: current water deficit in 90 cm of soil
 def getSoilInfiltration(basin, deficit90):
-    if basin == QUADERNA:
-        infMax = 2.0        # mm/hour representative of very dry soil
-        infMin = 0.2        # mm/hour representative of saturated soil
-    else:
-        infMax = 6.0        # mm/hour representative of very dry soil
-        infMin = 0.2        # mm/hour representative of saturated soil
+    infMax, infMin = getInfiltrationParameters(basin)
     deficit90max = 100
     deficit90min = -40
     if deficit90 > deficit90max:
@@ -53,9 +120,7 @@ def getSoilInfiltration(basin, deficit90):
 
 # Vegetation maximum water storage [mm]
 def maxCropInterception(currentDate):
-    # {month:val} maximum water storage vegetation [mm]
-    vegetationStorage = {1: 2, 2: 2, 3: 3, 4: 5, 5: 6, 6: 7, 7: 8, 8: 7, 9: 7, 10: 5, 11: 4, 12: 3}
-    return vegetationStorage[currentDate.month]
+    return VEGETATION_STORAGE[currentDate.month]
 
 
 # Compute water level [m] from surface water content (swc) with basin specific parameters
@@ -64,9 +129,28 @@ def estimateLevel(swc, hMax, m, k, zeroIdro, swc0):
     return waterLevel
 
 
+# Inverse of estimateLevel (logit of the sigmoid): surface water content [mm] of a water level [m]
+# waterLevel must be in the open interval (zeroIdro, zeroIdro + hMax)
+def estimateSwc(waterLevel, hMax, m, k, zeroIdro, swc0):
+    relativeLevel = waterLevel - zeroIdro
+    swc = swc0 + (np.log(m) - np.log(hMax / relativeLevel - 1)) / k
+    return swc
+
+
+# missing rainfall (nan) is not simulated: ValueError with the time step of the first missing value
+# the gaps of resampled series (resample.GAP_NAN) must be filled before the simulation
+def checkRainfall(precipitation):
+    isMissing = np.isnan(np.atleast_1d(np.asarray(precipitation, dtype=float)))
+    if isMissing.any():
+        timeStep = int(np.argwhere(isMissing)[0][-1])
+        raise ValueError("missing rainfall (nan) at time step " + str(timeStep) + ": fill the gaps before the simulation")
+
+
 # Main function transforming inflows in outflows
+# basin: basin id or BasinParameters record
 def computeWaterLevel(basin, currentDate, timeStep, rainfall, currentSwc, currentDeficit90, currentLeafIntercepted):
-    alpha = 0.18     # runoff decay factor, % of runoff that leaves the system in one hour
+    basin = getParameters(basin)
+    alpha = basin.alpha     # runoff decay factor, % of runoff that leaves the system in one hour
     nrIntervals = 3600 / timeStep
 
     # [mm] seasonal max crop interception 
@@ -92,12 +176,7 @@ def computeWaterLevel(basin, currentDate, timeStep, rainfall, currentSwc, curren
         newDeficit90 = currentDeficit90 - currentDeepInfiltration
 
     # basin parameters
-    if basin == RAVONE:
-        zeroIdro, hMax, m, k, swc0 = getBasinParameters_Ravone()
-    elif basin == QUADERNA:
-        zeroIdro, hMax, m, k, swc0 = getBasinParameters_Quaderna()
-    else:
-        zeroIdro, hMax, m, k, swc0 = getBasinParameters_Ravone()
+    zeroIdro, hMax, m, k, swc0 = getBasinParameters(basin)
 
     if newSwc > 0:
         waterLevel = estimateLevel(newSwc, hMax, m, k, zeroIdro, swc0)      # [m]
@@ -108,12 +187,20 @@ def computeWaterLevel(basin, currentDate, timeStep, rainfall, currentSwc, curren
 
 
 # main looping over precipitation a calling other functions
-def creek(basin, df_in, precFieldName, deficit35, deficit90):
+# engine: REFERENCE (computeWaterLevel at each timestep) or KERNEL (soilWaterKernel, same results)
+# levelMethod: LEVEL_EXACT (sigmoid function) or LEVEL_TABLE (interpolated, see getLevelTable)
+# the time step of each value is the interval from the previous date of df_in.index (see getTimeSteps)
+def creek(basin, df_in, precFieldName, deficit35, deficit90, engine=REFERENCE, levelMethod=LEVEL_EXACT):
+    if engine == KERNEL:
+        return creekKernel(basin, df_in, precFieldName, deficit35, deficit90, levelMethod)
+
     # initialize
+    basin = getParameters(basin)
     df_out = df_in
 
     # [mm] precipitation
     precipitation = df_in[precFieldName]
+    checkRainfall(precipitation)
 
     # [m] estimated Level vector
     nrData = len(precipitation)
@@ -123,7 +210,7 @@ def creek(basin, df_in, precFieldName, deficit35, deficit90):
 
     # initialize with first value
     currentDate = df_in.index[0]
-    timeStep = (df_in.index[1] - df_in.index[0]).total_seconds()
+    timeSteps = getTimeSteps(df_in.index).tolist()
     dateStr = currentDate.strftime("%Y_%m_%d")
 
     # [mm] current water storages (swc: surface and first soil layer)
@@ -136,12 +223,372 @@ def creek(basin, df_in, precFieldName, deficit35, deficit90):
         currentDate = df_in.index[j]
 
         # compute current surface water content and water level
-        waterLevel, swc, currentWHC90, LeafIntercepted = computeWaterLevel(basin, currentDate, timeStep, precipitation[j], swc,
+        waterLevel, swc, currentWHC90, LeafIntercepted = computeWaterLevel(basin, currentDate, timeSteps[j], precipitation[j], swc,
                                                                            currentWHC90, LeafIntercepted)
         estLevel[j] = waterLevel
         swcout[j] = swc
         whc90out[j] = currentWHC90
 
+    if levelMethod == LEVEL_TABLE:
+        estLevel = computeLevels(basin, swcout, levelMethod)
+
+    # estimated datasets
+    df_out['estLevel'] = estLevel
+    df_out['swc'] = swcout
+    df_out['WHC90'] = whc90out
+
+    return df_out
+
+
+# Water infiltration in deep soil layer [mm/hour], array version of getSoilInfiltration
+def getSoilInfiltrationArray(basin, deficit90):
+    infMax, infMin = getInfiltrationParameters(basin)
+    deficit90max = 100
+    deficit90min = -40
+    ratio = (deficit90 - deficit90min) / (deficit90max - deficit90min)
+    currentInf = np.where(deficit90 > deficit90max, infMax,
+                          np.where(deficit90 < deficit90min, infMin, infMin + ratio*ratio * infMax))
+    return currentInf
+
+
+# Vegetation maximum water storage [mm] for each date of the series (DatetimeIndex)
+def maxCropInterceptionSeries(dates):
+    monthStorage = np.zeros(13)
+    for month, storage in VEGETATION_STORAGE.items():
+        monthStorage[month] = storage
+    return monthStorage[np.asarray(dates.month)]
+
+
+# [s] time step of each date of the series (DatetimeIndex): interval from the previous date,
+# the first interval is equal to the second one
+def getTimeSteps(dates):
+    timeSteps = np.diff(np.asarray(dates.asi8)) / 1e9
+    return np.concatenate([timeSteps[:1], timeSteps])
+
+
+# Array version of computeWaterLevel: advances all the members of an ensemble of one timestep
+# maxStorage: vegetation maximum water storage [mm] at the current date
+def computeWaterLevelArray(basin, maxStorage, timeStep, rainfall, currentSwc, currentDeficit90, currentLeafIntercepted):
+    newSwc, newDeficit90, newLeafIntercepted = computeSoilWaterArray(basin, maxStorage, timeStep, rainfall, currentSwc,
+                                                                     currentDeficit90, currentLeafIntercepted)
+    # basin parameters
+    zeroIdro, hMax, m, k, swc0 = getBasinParameters(basin)
+    waterLevel = np.where(newSwc > 0, estimateLevel(newSwc, hMax, m, k, zeroIdro, swc0), zeroIdro)     # [m]
+
+    return waterLevel, newSwc, newDeficit90, newLeafIntercepted
+
+
+# water storages of computeWaterLevelArray, without the water level
+def computeSoilWaterArray(basin, maxStorage, timeStep, rainfall, currentSwc, currentDeficit90, currentLeafIntercepted):
+    basin = getParameters(basin)
+    alpha = basin.alpha     # runoff decay factor, % of runoff that leaves the system in one hour
+    nrIntervals = 3600 / timeStep
+
+    # [mm] seasonal max crop interception
+    maxInterception = np.maximum(0, maxStorage - currentLeafIntercepted)
+    currentLeafInterception = np.minimum(rainfall * 0.2, maxInterception)
+    newLeafIntercepted = currentLeafIntercepted + currentLeafInterception
+
+    # rain reaching the soil [mm]
+    rainReachingSoil = rainfall - currentLeafInterception
+    # maximum amount of water that can infiltrate into deep soil [mm]
+    maxDeepInfiltration = getSoilInfiltrationArray(basin, currentDeficit90) / nrIntervals
+    # current deep infiltration [mm]
+    currentDeepInfiltration = np.minimum(rainReachingSoil, maxDeepInfiltration)
+
+    # phase 1 (swc < 0): rain reaching the ground infiltrates completely
+    # phase 2 (swc >= 0): rain only partially infiltrates and begins to produce runoff
+    isPhase1 = currentSwc < 0
+    runoff = currentSwc * (alpha / nrIntervals)
+    newSwc = np.where(isPhase1, currentSwc + rainReachingSoil - currentDeepInfiltration,
+                      np.maximum(currentSwc + rainReachingSoil - runoff - currentDeepInfiltration, 0))
+    newDeficit90 = np.where(isPhase1, currentDeficit90 - rainReachingSoil, currentDeficit90 - currentDeepInfiltration)
+
+    return newSwc, newDeficit90, newLeafIntercepted
+
+
+# ensemble version of creek: all members are advanced together at each timestep
+# deficit35, deficit90: [mm] initial deficits of the N members (arrays or scalars)
+# precipitation: optional [mm] N x T rainfall matrix (or T vector), default df_in[precFieldName]
+# levelMethod: LEVEL_EXACT or LEVEL_TABLE
+# returns N x T arrays of estimated level, swc and WHC90
+def creekEnsemble(basin, df_in, precFieldName, deficit35, deficit90, precipitation=None, levelMethod=LEVEL_EXACT):
+    if precipitation is None:
+        precipitation = df_in[precFieldName].values
+    return runEnsemble(basin, df_in.index, precipitation, deficit35, deficit90, levelMethod)
+
+
+# state of the members of an ensemble advanced together at each time step (see stepEnsemble)
+# basin: basin id, BasinParameters record or record of parameter arrays (see stackBasinParameters)
+# swc, deficit90, leafIntercepted: [mm] initial water storages of the members (arrays or scalars)
+# the number of members is the largest size of the storages, of the parameters and nrMembers
+class EnsembleState:
+    def __init__(self, basin, swc, deficit90, leafIntercepted=0, nrMembers=1):
+        self.basin = getParameters(basin)
+        self.nrMembers = max(np.size(swc), np.size(deficit90), np.size(leafIntercepted), nrMembers,
+                             *[np.size(value) for value in self.basin])
+        self.swc = np.broadcast_to(np.asarray(swc, dtype=float), self.nrMembers)
+        self.deficit90 = np.broadcast_to(np.asarray(deficit90, dtype=float), self.nrMembers)
+        self.leafIntercepted = np.broadcast_to(np.asarray(leafIntercepted, dtype=float), self.nrMembers)
+        # indices of the members still simulated
+        self.members = np.arange(self.nrMembers)
+
+    # keep only the selected members (boolean array over the members still simulated)
+    def select(self, isKept):
+        self.basin = BasinParameters(*[value[isKept] if np.ndim(value) > 0 and np.size(value) == len(isKept)
+                                       else value for value in self.basin])
+        self.members = self.members[isKept]
+        self.swc, self.deficit90, self.leafIntercepted = \
+            self.swc[isKept], self.deficit90[isKept], self.leafIntercepted[isKept]
+
+
+# ensemble cycle over dates (DatetimeIndex): advances the members of state with the rows of precipitation
+# ([mm] members x time, or time) and yields the index of each time step after updating state
+# between two steps the caller can change the storages of state or remove members (select),
+# the cycle ends when no member is left
+def stepEnsemble(state, dates, precipitation):
+    precipitation = np.atleast_2d(np.asarray(precipitation, dtype=float))
+    checkRainfall(precipitation)
+    nrData = precipitation.shape[1]
+    timeSteps = getTimeSteps(dates)
+    maxStorage = maxCropInterceptionSeries(dates)
+    precipitation = np.broadcast_to(precipitation, (state.nrMembers, nrData))
+
+    # main cycle
+    for j in range(nrData):
+        if len(state.members) == 0:
+            return
+        if len(state.members) == state.nrMembers:
+            rainfall = precipitation[:, j]
+        else:
+            rainfall = precipitation[state.members, j]
+        state.swc, state.deficit90, state.leafIntercepted = \
+            computeSoilWaterArray(state.basin, maxStorage[j], timeSteps[j], rainfall,
+                                  state.swc, state.deficit90, state.leafIntercepted)
+        yield j
+
+
+# [mm] initial swc of deficit35 (surface and first soil layer)
+def getInitialSwc(deficit35):
+    return np.minimum(-np.asarray(deficit35, dtype=float), 0)
+
+
+# ensemble cycle over dates (DatetimeIndex): the members are given by the rows of precipitation,
+# by the deficit arrays or by a record of parameter arrays (see stackBasinParameters)
+def runEnsemble(basin, dates, precipitation, deficit35, deficit90, levelMethod=LEVEL_EXACT):
+    precipitation = np.atleast_2d(np.asarray(precipitation, dtype=float))
+    state = EnsembleState(basin, getInitialSwc(deficit35), deficit90, 0, precipitation.shape[0])
+    nrData = precipitation.shape[1]
+
+    swcout = np.zeros((state.nrMembers, nrData))
+    whc90out = np.zeros((state.nrMembers, nrData))
+    for j in stepEnsemble(state, dates, precipitation):
+        swcout[:, j] = state.swc
+        whc90out[:, j] = state.deficit90
+
+    # [m] estimated Level matrix
+    estLevel = computeLevels(state.basin, swcout, levelMethod)
+
+    return estLevel, swcout, whc90out
+
+
+# record of parameter arrays (one value for each basin) from a list of basin ids or BasinParameters records
+def stackBasinParameters(basinsList):
+    parametersList = [getParameters(basin) for basin in basinsList]
+    return BasinParameters(*[np.array(values, dtype=float) for values in zip(*parametersList)])
+
+
+# multi-basin version of creek: all basins are advanced together at each timestep
+# basinsList: basin ids or BasinParameters records
+# dates: DatetimeIndex of the common time window
+# precipitation: [mm] basins x time rainfall matrix
+# deficit35, deficit90: [mm] initial deficits of each basin
+# returns basins x time arrays of estimated level, swc and WHC90
+def creekBasins(basinsList, dates, precipitation, deficit35, deficit90):
+    return runEnsemble(stackBasinParameters(basinsList), dates, precipitation, deficit35, deficit90)
+
+
+# Compute water level [m] of an array of swc: zeroIdro where swc is not positive
+def estimateLevelArray(swc, hMax, m, k, zeroIdro, swc0):
+    swc = np.asarray(swc, dtype=float)
+    waterLevel = np.full(swc.shape, float(zeroIdro))
+    isRunoff = swc > 0
+    waterLevel[isRunoff] = estimateLevel(swc[isRunoff], hMax, m, k, zeroIdro, swc0)
+    return waterLevel
+
+
+# in memory cache {(BasinParameters, tolerance): LevelTable}
+_levelTables = {}
+
+
+# Table of the sigmoid function of a basin with maximum linear interpolation error tolerance [m]
+# the grid step comes from the bound h*h/8 * max|f''| of the interpolation error, with max|f''| = hMax*k*k/(6*sqrt(3));
+# the grid ends where the sigmoid is within tolerance of its maximum, so clamping beyond it respects the bound
+def getLevelTable(basin, tolerance=LEVEL_TABLE_TOLERANCE):
+    parameters = getParameters(basin)
+    key = (parameters, tolerance)
+    if key not in _levelTables:
+        zeroIdro, hMax, m, k, swc0 = getBasinParameters(parameters)
+        maxCurvature = hMax * k * k / (6 * np.sqrt(3))
+        step = np.sqrt(8 * tolerance / maxCurvature)
+        swcMax = max(swc0 + np.log(max(m * hMax / tolerance, 1)) / k, step)
+        nrIntervals = int(np.ceil(swcMax / step))
+        step = swcMax / nrIntervals
+        level = estimateLevel(step * np.arange(nrIntervals + 1), hMax, m, k, zeroIdro, swc0)
+        # last slope is zero: constant level beyond the table
+        slope = np.append(np.diff(level), 0)
+        _levelTables[key] = LevelTable(step, level, slope, zeroIdro, tolerance)
+    return _levelTables[key]
+
+
+# Linear interpolation on the table nodes in one pass (compiled with numba)
+@njit(cache=True)
+def levelTableKernel(swc, step, level, slope, zeroIdro):
+    lastIndex = len(level) - 1
+    inverseStep = 1 / step
+    flatSwc = swc.ravel()
+    waterLevel = np.empty(flatSwc.size)
+    for i in range(flatSwc.size):
+        if flatSwc[i] > 0:
+            position = flatSwc[i] * inverseStep
+            if position > lastIndex:
+                position = lastIndex
+            index = int(position)
+            waterLevel[i] = level[index] + (position - index) * slope[index]
+        else:
+            waterLevel[i] = zeroIdro
+    return waterLevel.reshape(swc.shape)
+
+
+# Water level [m] of an array of swc interpolated on a LevelTable
+def estimateLevelTable(swc, table):
+    swc = np.asarray(swc, dtype=float)
+    if NUMBA_AVAILABLE:
+        return levelTableKernel(np.ascontiguousarray(swc), table.step, table.level, table.slope, table.zeroIdro)
+
+    # fmax and fmin send nan to the first node
+    position = np.fmin(np.fmax(swc * (1 / table.step), 0), len(table.level) - 1)
+    index = position.astype(np.intp)
+    waterLevel = table.level[index] + (position - index) * table.slope[index]
+    return np.where(swc > 0, waterLevel, table.zeroIdro)
+
+
+# Water level [m] of an array of swc (members x time if basin is a record of parameter arrays)
+def computeLevels(basin, swc, levelMethod=LEVEL_EXACT):
+    if levelMethod == LEVEL_TABLE:
+        return estimateLevelTable(swc, getLevelTable(basin))
+
+    swc = np.asarray(swc, dtype=float)
+    zeroIdro, hMax, m, k, swc0 = getBasinParameters(basin)
+    if np.ndim(hMax) == 0 and np.ndim(m) == 0 and np.ndim(k) == 0 and np.ndim(zeroIdro) == 0 and np.ndim(swc0) == 0:
+        return estimateLevelArray(swc, hMax, m, k, zeroIdro, swc0)
+
+    # parameters of each member on the rows
+    zeroIdro, hMax, m, k, swc0 = [np.reshape(value, (-1,) + (1,) * (swc.ndim - 1))
+                                  for value in (zeroIdro, hMax, m, k, swc0)]
+    with np.errstate(over='ignore'):
+        return np.where(swc > 0, estimateLevel(swc, hMax, m, k, zeroIdro, swc0), zeroIdro)
+
+
+# Time recurrence of computeWaterLevel over plain float arrays (compiled with numba if available)
+# precipitation, maxStorage: [mm] rainfall and vegetation maximum water storage at each timestep
+# nrIntervals: number of timesteps in one hour (3600 / timeStep) at each timestep
+# returns swc and deficit90 series, and the final leaf interception
+@njit(cache=True)
+def soilWaterKernel(precipitation, maxStorage, nrIntervals, alpha, infMax, infMin,
+                    swc, deficit90, leafIntercepted):
+    deficit90max = 100
+    deficit90min = -40
+    nrData = len(precipitation)
+    swcout = np.zeros(nrData)
+    whc90out = np.zeros(nrData)
+
+    for j in range(nrData):
+        rainfall = precipitation[j]
+
+        # [mm] seasonal max crop interception
+        maxInterception = maxStorage[j] - leafIntercepted
+        if not (maxInterception > 0):
+            maxInterception = 0.0
+        leafInterception = rainfall * 0.2
+        if maxInterception < leafInterception:
+            leafInterception = maxInterception
+        leafIntercepted = leafIntercepted + leafInterception
+
+        # rain reaching the soil [mm]
+        rainReachingSoil = rainfall - leafInterception
+
+        # maximum amount of water that can infiltrate into deep soil [mm]
+        if deficit90 > deficit90max:
+            currentInf = infMax
+        elif deficit90 < deficit90min:
+            currentInf = infMin
+        else:
+            ratio = (deficit90 - deficit90min) / (deficit90max - deficit90min)
+            currentInf = infMin + ratio*ratio * infMax
+        maxDeepInfiltration = currentInf / nrIntervals[j]
+        deepInfiltration = rainReachingSoil
+        if maxDeepInfiltration < deepInfiltration:
+            deepInfiltration = maxDeepInfiltration
+
+        if swc < 0:
+            # phase 1: complete infiltration
+            swc = swc + rainReachingSoil - deepInfiltration
+            deficit90 = deficit90 - rainReachingSoil
+        else:
+            # phase 2: runoff
+            runoff = swc * (alpha / nrIntervals[j])
+            swc = swc + rainReachingSoil - runoff - deepInfiltration
+            if 0 > swc:
+                swc = 0.0
+            deficit90 = deficit90 - deepInfiltration
+
+        swcout[j] = swc
+        whc90out[j] = deficit90
+
+    return swcout, whc90out, leafIntercepted
+
+
+# Run soilWaterKernel with the basin parameters
+# timeStep: [s] constant time step or array of the time step of each value (see getTimeSteps)
+# returns estimated level, swc and WHC90 series, and the final leaf interception
+def runSoilWaterKernel(basin, precipitation, maxStorage, timeStep, swc, deficit90, leafIntercepted,
+                       levelMethod=LEVEL_EXACT):
+    basin = getParameters(basin)
+    alpha = basin.alpha     # runoff decay factor, % of runoff that leaves the system in one hour
+    nrIntervals = 3600 / np.broadcast_to(np.asarray(timeStep, dtype=float), np.shape(precipitation))
+    infMax, infMin = getInfiltrationParameters(basin)
+    checkRainfall(precipitation)
+
+    if NUMBA_AVAILABLE:
+        precipitation = np.asarray(precipitation, dtype=float)
+        maxStorage = np.asarray(maxStorage, dtype=float)
+        nrIntervals = np.ascontiguousarray(nrIntervals)
+    else:
+        # python floats are much faster than numpy scalars in the uncompiled loop
+        precipitation = np.asarray(precipitation, dtype=float).tolist()
+        maxStorage = np.asarray(maxStorage, dtype=float).tolist()
+        nrIntervals = nrIntervals.tolist()
+
+    swcout, whc90out, leafIntercepted = soilWaterKernel(precipitation, maxStorage, nrIntervals, alpha,
+                                                        float(infMax), float(infMin), float(swc),
+                                                        float(deficit90), float(leafIntercepted))
+
+    estLevel = computeLevels(basin, swcout, levelMethod)
+    return estLevel, swcout, whc90out, leafIntercepted
+
+
+# creek computed with the scan kernel: same output of the reference engine
+def creekKernel(basin, df_in, precFieldName, deficit35, deficit90, levelMethod=LEVEL_EXACT):
+    df_out = df_in
+
+    timeSteps = getTimeSteps(df_in.index)
+    maxStorage = maxCropInterceptionSeries(df_in.index)
+    swc = min(-deficit35, 0)
+
+    estLevel, swcout, whc90out, _ = runSoilWaterKernel(basin, df_in[precFieldName].values, maxStorage, timeSteps,
+                                                       swc, deficit90, 0, levelMethod)
+
     # estimated datasets
     df_out['estLevel'] = estLevel
     df_out['swc'] = swcout
@@ -0,0 +1,94 @@
+# alarm thresholds of Criteria-Rainbo levels (e.g. warning, prealarm, alarm of basins.json alarmLevels):
+# first crossing time and time above each level, for each member of an ensemble
+# with early exit a member stops being simulated once all its thresholds are resolved: a threshold is also
+# resolved as not crossed when the level is below it and no more rain falls (the level can only decrease)
+
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import Criteria_Rainbo_model as rainbo
+
+ALARM_CROSSING = 'crossing'     # a threshold is resolved at its first crossing
+ALARM_EPISODE = 'episode'       # a threshold is resolved when the level is below it and no more rain falls
+
+# alarmLevels: [m] thresholds
+# crossingTime: members x alarms first crossing times (NaT if not crossed)
+# duration: [hours] members x alarms time above the thresholds, until the member stops
+# lastTime: last simulated time of each member
+AlarmResult = namedtuple('AlarmResult', ['alarmLevels', 'crossingTime', 'duration', 'lastTime'])
+
+
+# index of the first time step with level >= each alarm level (-1 if never): members x alarms
+def getFirstCrossings(estLevel, alarmLevels):
+    isAbove = estLevel[:, np.newaxis, :] >= np.asarray(alarmLevels, dtype=float)[np.newaxis, :, np.newaxis]
+    return np.where(isAbove.any(axis=2), isAbove.argmax(axis=2), -1)
+
+
+# crossings of complete level series (members x time): AlarmResult of the whole series
+def getAlarms(dates, estLevel, alarmLevels):
+    dates = pd.DatetimeIndex(dates)
+    estLevel = np.atleast_2d(estLevel)
+    alarmLevels = np.atleast_1d(np.asarray(alarmLevels, dtype=float))
+    timeSteps = rainbo.getTimeSteps(dates)
+
+    isAbove = estLevel[:, np.newaxis, :] >= alarmLevels[np.newaxis, :, np.newaxis]
+    duration = (isAbove * timeSteps).sum(axis=2) / 3600
+    crossingTime = _getTimes(dates, getFirstCrossings(estLevel, alarmLevels))
+    lastTime = np.full(estLevel.shape[0], dates.values[-1])
+    return AlarmResult(alarmLevels, crossingTime, duration, lastTime)
+
+
+# dates of an array of time step indices, NaT for -1
+def _getTimes(dates, index):
+    return dates.append(pd.DatetimeIndex([pd.NaT], tz=dates.tz)).values[index]
+
+
+# ensemble simulation returning only the alarm crossings (see runEnsemble for the arguments)
+# earlyExit: None (simulate the whole series), ALARM_CROSSING or ALARM_EPISODE
+# the members that have resolved all the thresholds are removed from the ensemble at each time step,
+# the simulation ends when no member is left
+def runAlarms(basin, dates, precipitation, deficit35, deficit90, alarmLevels, earlyExit=None,
+              levelMethod=rainbo.LEVEL_EXACT):
+    dates = pd.DatetimeIndex(dates)
+    precipitation = np.atleast_2d(np.asarray(precipitation, dtype=float))
+    alarmLevels = np.atleast_1d(np.asarray(alarmLevels, dtype=float))
+    state = rainbo.EnsembleState(basin, rainbo.getInitialSwc(deficit35), deficit90, 0, precipitation.shape[0])
+    nrMembers = state.nrMembers
+    nrData = precipitation.shape[1]
+    nrAlarms = len(alarmLevels)
+    timeSteps = rainbo.getTimeSteps(dates)
+
+    # last time step with rain of each member (-1 if dry)
+    isRain = precipitation > 0
+    lastRain = np.where(isRain.any(axis=1), nrData - 1 - isRain[:, ::-1].argmax(axis=1), -1)
+    lastRain = np.broadcast_to(lastRain, nrMembers)
+
+    crossingIndex = np.full((nrMembers, nrAlarms), -1)
+    duration = np.zeros((nrMembers, nrAlarms))
+    lastIndex = np.full(nrMembers, nrData - 1)
+
+    for j in rainbo.stepEnsemble(state, dates, precipitation):
+        active = state.members
+        waterLevel = rainbo.computeLevels(state.basin, state.swc, levelMethod)
+
+        isAbove = waterLevel[:, np.newaxis] >= alarmLevels
+        duration[active] += isAbove * (timeSteps[j] / 3600)
+        activeCrossing = crossingIndex[active]
+        isCrossed = activeCrossing >= 0
+        activeCrossing[isAbove & ~isCrossed] = j
+        crossingIndex[active] = activeCrossing
+
+        if earlyExit is None:
+            continue
+        # after the last rain the level can only decrease: no later crossing or episode above the thresholds
+        isDry = (lastRain[active] <= j)[:, np.newaxis]
+        if earlyExit == ALARM_CROSSING:
+            isResolved = ((activeCrossing >= 0) | isDry).all(axis=1)
+        else:
+            # all the episodes above the thresholds are counted in duration
+            isResolved = (~isAbove & isDry).all(axis=1)
+        if isResolved.any():
+            lastIndex[active[isResolved]] = j
+            state.select(~isResolved)
+
+    return AlarmResult(alarmLevels, _getTimes(dates, crossingIndex), duration, dates.values[lastIndex])
@@ -0,0 +1,83 @@
+# data assimilation of observed levels (Livello) in Criteria-Rainbo model
+# the observed level is converted to an observed swc with the inverse of the sigmoid (estimateSwc),
+# then the model swc is corrected with a constant gain (nudging) or with an ensemble Kalman update
+# all the functions work on arrays of members or basins (records of parameter arrays)
+
+import numpy as np
+import pandas as pd
+import Criteria_Rainbo_model as rainbo
+
+DEFAULT_GAIN = 0.3
+
+# [m] observed levels closer than this to the upper asymptote (zeroIdro + hMax) are clamped
+LEVEL_MARGIN = 0.001
+
+
+# observed swc [mm] of observed levels [m], nan where the level gives no information:
+# missing level, or level at the base flow (swc <= 0) while the model has no runoff (modelSwc <= 0)
+# below the level of swc = 0 the observed swc is 0 (the sigmoid is not defined for negative swc)
+def getObservedSwc(basin, observedLevel, modelSwc):
+    zeroIdro, hMax, m, k, swc0 = rainbo.getBasinParameters(basin)
+    observedLevel = np.asarray(observedLevel, dtype=float)
+    modelSwc = np.asarray(modelSwc, dtype=float)
+
+    baseLevel = rainbo.estimateLevel(0, hMax, m, k, zeroIdro, swc0)
+    level = np.clip(observedLevel, baseLevel, zeroIdro + hMax - LEVEL_MARGIN)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        observedSwc = np.maximum(rainbo.estimateSwc(level, hMax, m, k, zeroIdro, swc0), 0)
+    isBase = observedLevel <= baseLevel
+    return np.where(np.isnan(observedLevel) | (isBase & (modelSwc <= 0)), np.nan, observedSwc)
+
+
+# nudging: model swc moved towards the observed swc by gain (0 = open loop, 1 = observed swc)
+def nudgeSwc(basin, modelSwc, observedLevel, gain=DEFAULT_GAIN):
+    modelSwc = np.asarray(modelSwc, dtype=float)
+    observedSwc = getObservedSwc(basin, observedLevel, modelSwc)
+    return np.where(np.isnan(observedSwc), modelSwc, modelSwc + gain * (observedSwc - modelSwc))
+
+
+# stochastic ensemble Kalman update of the swc of the members of one basin with one observed level [m]
+# observationError: [m] standard deviation of the level observation
+# the update is computed in level space (observation operator = sigmoid), the members are moved
+# with the gain cov(swc, level) / (var(level) + observationError^2) towards perturbed observations
+def ensembleKalmanUpdate(basin, memberSwc, observedLevel, observationError, rng=None):
+    memberSwc = np.asarray(memberSwc, dtype=float)
+    if np.isnan(observedLevel) or len(memberSwc) < 2:
+        return memberSwc
+    rng = np.random.default_rng() if rng is None else rng
+
+    memberLevel = rainbo.computeLevels(basin, memberSwc)
+    levelAnomaly = memberLevel - memberLevel.mean()
+    swcAnomaly = memberSwc - memberSwc.mean()
+    nrMembers = len(memberSwc)
+    covariance = (swcAnomaly * levelAnomaly).sum() / (nrMembers - 1)
+    variance = (levelAnomaly ** 2).sum() / (nrMembers - 1)
+    gain = covariance / (variance + observationError ** 2)
+
+    perturbedLevel = observedLevel + rng.normal(0, observationError, nrMembers)
+    return memberSwc + gain * (perturbedLevel - memberLevel)
+
+
+# simulation with nudging at each observed time step (see runEnsemble for the arguments)
+# observed: [m] members x time (or time) observed levels, nan where missing
+# returns the levels forecast one step ahead (before the update), the swc after the update and WHC90
+def runAssimilation(basin, dates, precipitation, observed, deficit35, deficit90, gain=DEFAULT_GAIN,
+                    levelMethod=rainbo.LEVEL_EXACT):
+    dates = pd.DatetimeIndex(dates)
+    precipitation = np.atleast_2d(np.asarray(precipitation, dtype=float))
+    observed = np.atleast_2d(np.asarray(observed, dtype=float))
+    state = rainbo.EnsembleState(basin, rainbo.getInitialSwc(deficit35), deficit90, 0,
+                                 max(precipitation.shape[0], observed.shape[0]))
+    nrData = precipitation.shape[1]
+    observed = np.broadcast_to(observed, (state.nrMembers, nrData))
+
+    estLevel = np.zeros((state.nrMembers, nrData))
+    swcout = np.zeros((state.nrMembers, nrData))
+    whc90out = np.zeros((state.nrMembers, nrData))
+    for j in rainbo.stepEnsemble(state, dates, precipitation):
+        estLevel[:, j] = rainbo.computeLevels(state.basin, state.swc, levelMethod)
+        state.swc = nudgeSwc(state.basin, state.swc, observed[:, j], gain)
+        swcout[:, j] = state.swc
+        whc90out[:, j] = state.deficit90
+
+    return estLevel, swcout, whc90out
@@ -0,0 +1,59 @@
+# registry of the basins: paths, thresholds and model parameters loaded from basins.json
+
+import glob
+import json
+import os
+import Criteria_Rainbo_model as rainbo
+
+BASINS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "basins.json")
+
+# in memory cache {fileName: registry}
+_registries = {}
+
+
+# load the registry: {name: settings}, settings['parameters'] is a BasinParameters record
+# and settings['parameterValues'] the original values of basins.json
+def loadBasins(fileName=BASINS_FILE):
+    if fileName in _registries:
+        return _registries[fileName]
+
+    with open(fileName) as basinsFile:
+        config = json.load(basinsFile)
+
+    registry = {}
+    for name, settings in config.items():
+        settings = dict(settings)
+        settings['name'] = name
+        settings['criteriaOutputFileName'] = os.path.join(settings['inputPath'], settings['criteriaOutput'])
+        settings['parameterValues'] = dict(settings['parameters'])
+        settings['parameters'] = rainbo.makeBasinParameters(**settings['parameters'])
+        registry[name] = settings
+
+    _registries[fileName] = registry
+    return registry
+
+
+# settings of a basin, selected by name (e.g. 'QUADERNA') or by id (e.g. rainbo.QUADERNA)
+def getBasin(basin, fileName=BASINS_FILE):
+    registry = loadBasins(fileName)
+    if basin in registry:
+        return registry[basin]
+    for settings in registry.values():
+        if settings.get('id') == basin:
+            return settings
+    raise KeyError("unknown basin: " + str(basin))
+
+
+# record of parameter arrays of a set of basins (default all the registry), in the order of names
+def getRegionalParameters(names=None, fileName=BASINS_FILE):
+    registry = loadBasins(fileName)
+    if names is None:
+        names = list(registry)
+    return rainbo.stackBasinParameters([getBasin(name, fileName)['parameters'] for name in names])
+
+
+# event files of a basin: files matching the glob patterns, default the eventPattern in the inputPath of the basin
+def getEventFiles(settings, patterns=None):
+    if not patterns:
+        patterns = [settings['inputPath'] + settings['eventPattern']]
+    return sorted({fileName for pattern in patterns for fileName in glob.glob(pattern)})
@@ -0,0 +1,273 @@
+# benchmark of Criteria-Rainbo engines on synthetic rainfall: time steps/second and peak memory
+# engines: reference and kernel creek, ensemble (runEnsemble), real-time stepper (computeWaterLevel),
+# daily deficits lookup and the validation event loop
+# the results are compared with a baseline file (benchmark_baseline.json) to make regressions visible
+# peak memory is measured with tracemalloc: Python and NumPy allocations (not the numba internal buffers)
+
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import Criteria_Rainbo_model as rainbo
+import basins
+import deficits
+from realtime import CreekState
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# [s] time steps of the synthetic series
+TIME_STEPS = {'15min': 900, '5min': 300, '1min': 60}
+
+# [days] lengths of the synthetic series
+DURATIONS = {'1D': 1, '1M': 30, '1Y': 365, '10Y': 3650, '30Y': 10950}
+
+ENSEMBLE_SIZES = [1, 10, 100, 1000, 10000]
+
+# maximum number of member time steps of each engine (bigger cases are skipped)
+MAX_STEPS = {'reference': 2e5,
+             'kernel': 2e7,
+             'kernel_table': 2e7,
+             'ensemble': 5e7,
+             'realtime': 5e4,
+             'deficits': 1e5}
+
+# maximum length of the series of the engines with a python cycle over time
+MAX_TIME_STEPS = {'reference': 2e5,
+                  'ensemble': 1.1e5,
+                  'realtime': 5e4}
+
+# quick run: only the shortest series
+QUICK_DURATIONS = ['1D', '1M']
+
+# [mm] initial deficits of the synthetic runs
+DEFICIT35 = 20.0
+DEFICIT90 = 60.0
+
+# relative decrease of steps/second reported as a regression
+REGRESSION_TOLERANCE = 0.2
+
+
+# synthetic rainfall [mm] (members x time steps): wet spells of a two-state Markov chain,
+# gamma distributed intensities [mm/hour]
+def makeRainfall(timeStep, nrDays, nrMembers=1, seed=0, wetProbability=0.02, wetPersistence=0.9,
+                 meanIntensity=3.0):
+    rng = np.random.default_rng(seed)
+    nrSteps = int(round(nrDays * 86400 / timeStep))
+
+    # alternate dry and wet spells of geometric length: mean 1/p01 and 1/(1 - wetPersistence) steps
+    p01 = wetProbability * (1 - wetPersistence) / (1 - wetProbability)
+    meanCycle = 1 / p01 + 1 / (1 - wetPersistence)
+    nrSpells = int(nrSteps / meanCycle) + 10
+    isWet = np.zeros((nrMembers, nrSteps), dtype=bool)
+    for i in range(nrMembers):
+        spells = np.zeros(0, dtype=np.int64)
+        while spells.sum() < nrSteps:
+            lengths = np.empty(2 * nrSpells, dtype=np.int64)
+            lengths[0::2] = rng.geometric(p01, nrSpells)
+            lengths[1::2] = rng.geometric(1 - wetPersistence, nrSpells)
+            spells = np.concatenate([spells, lengths])
+        isWet[i] = np.repeat(np.tile([False, True], len(spells) // 2), spells)[:nrSteps]
+
+    intensity = rng.gamma(0.6, meanIntensity / 0.6, size=(nrMembers, nrSteps))
+    return np.where(isWet, intensity * timeStep / 3600, 0.0)
+
+
+def makeDates(timeStep, nrSteps, start='2020-01-01'):
+    return pd.date_range(start, periods=nrSteps, freq=pd.Timedelta(seconds=timeStep))
+
+
+# run one case: returns [s] elapsed time and [MB] peak memory
+def measure(function, repeat=1):
+    elapsed = np.inf
+    for _ in range(repeat):
+        startTime = time.perf_counter()
+        function()
+        elapsed = min(elapsed, time.perf_counter() - startTime)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+# function running one case of an engine and its number of member time steps
+def getCase(engine, basin, timeStep, nrDays, nrMembers, seed=0):
+    precipitation = makeRainfall(timeStep, nrDays, nrMembers if engine == 'ensemble' else 1, seed)
+    nrSteps = precipitation.shape[1]
+    dates = makeDates(timeStep, nrSteps)
+
+    if engine in ['reference', 'kernel', 'kernel_table']:
+        methods = {'reference': (rainbo.REFERENCE, rainbo.LEVEL_EXACT),
+                   'kernel': (rainbo.KERNEL, rainbo.LEVEL_EXACT),
+                   'kernel_table': (rainbo.KERNEL, rainbo.LEVEL_TABLE)}
+        runEngine, levelMethod = methods[engine]
+
+        def function():
+            df_in = pd.DataFrame({'P': precipitation[0]}, index=dates)
+            rainbo.creek(basin, df_in, 'P', DEFICIT35, DEFICIT90, runEngine, levelMethod)
+        return function, nrSteps
+
+    if engine == 'ensemble':
+        def function():
+            rainbo.runEnsemble(basin, dates, precipitation, DEFICIT35, DEFICIT90)
+        return function, nrMembers * nrSteps
+
+    if engine == 'realtime':
+        def function():
+            state = CreekState(basin, timeStep, DEFICIT35, DEFICIT90)
+            for rainfall, timestamp in zip(precipitation[0], dates):
+                state.step(rainfall, timestamp)
+        return function, nrSteps
+
+    raise ValueError("unknown engine: " + engine)
+
+
+# lookups of the initial deficits of nrLookups random dates of the daily table of a basin
+def getDeficitsCase(basinName, nrLookups, seed=0):
+    dailyDeficits = deficits.loadDailyDeficits(basins.getBasin(basinName)['criteriaOutputFileName'])
+    days = dailyDeficits['days']
+    rng = np.random.default_rng(seed)
+    dayNumbers = rng.integers(days[1], days[-1] + 1, size=nrLookups)
+    dates = pd.to_datetime(dayNumbers, unit='D') + pd.Timedelta(hours=12)
+
+    def function():
+        for date in dates:
+            deficits.getInitialDeficits(dailyDeficits, date)
+    return function, nrLookups
+
+
+# validation of all the events of the default validation basin, without plots
+def getValidationCase():
+    import validation
+
+    settings = basins.getBasin(validation.DEFAULT_BASIN)
+    fileNames = basins.getEventFiles(settings)
+    nrSteps = sum(len(pd.read_csv(fileName, usecols=['Dataf'])) for fileName in fileNames)
+
+    # scipy is imported by scores at the first use: imported before the measure
+    import scipy.ndimage
+    import scipy.signal
+    import scipy.stats
+
+    def function():
+        validation.runValidation(settings, fileNames, nrWorkers=1, plots=False)
+    return function, nrSteps
+
+
+# run the benchmark: list of dictionaries of results
+# the ensemble sizes apply only to the ensemble engine
+def runBenchmark(engines, basinName='QUADERNA', timeSteps=None, durations=None, ensembleSizes=None,
+                 repeat=1, verbose=True):
+    basin = basins.getBasin(basinName)['parameters']
+    timeSteps = timeSteps or list(TIME_STEPS)
+    durations = durations or list(DURATIONS)
+    ensembleSizes = ensembleSizes or ENSEMBLE_SIZES
+
+    cases = []
+    for engine in engines:
+        if engine == 'deficits':
+            for nrLookups in [1000, 10000, 100000]:
+                if nrLookups <= MAX_STEPS[engine]:
+                    cases.append((engine, 'day', str(nrLookups), 1,
+                                  lambda n=nrLookups: getDeficitsCase(basinName, n)))
+        elif engine == 'validation':
+            cases.append((engine, 'event', 'all', 1, getValidationCase))
+        else:
+            for timeStepName in timeSteps:
+                for durationName in durations:
+                    timeStep = TIME_STEPS[timeStepName]
+                    nrDays = DURATIONS[durationName]
+                    if nrDays * 86400 / timeStep > MAX_TIME_STEPS.get(engine, np.inf):
+                        continue
+                    for nrMembers in (ensembleSizes if engine == 'ensemble' else [1]):
+                        if nrMembers * nrDays * 86400 / timeStep > MAX_STEPS[engine]:
+                            continue
+                        cases.append((engine, timeStepName, durationName, nrMembers,
+                                      lambda e=engine, t=timeStep, d=nrDays, n=nrMembers:
+                                      getCase(e, basin, t, d, n)))
+
+    # compile the numba kernels before timing
+    if rainbo.NUMBA_AVAILABLE:
+        getCase('kernel', basin, 900, 1, 1)[0]()
+        getCase('kernel_table', basin, 900, 1, 1)[0]()
+
+    results = []
+    for engine, timeStepName, durationName, nrMembers, makeCase in cases:
+        function, nrSteps = makeCase()
+        elapsed, peakMemory = measure(function, repeat)
+        result = {'engine': engine, 'timeStep': timeStepName, 'duration': durationName, 'members': nrMembers,
+                  'steps': int(nrSteps), 'seconds': round(elapsed, 4),
+                  'stepsPerSecond': round(nrSteps / elapsed, 1), 'peakMemoryMB': round(peakMemory, 2)}
+        results.append(result)
+        if verbose:
+            print(getCaseName(result), "\tsteps/s: ", result['stepsPerSecond'],
+                  "\tpeak memory [MB]: ", result['peakMemoryMB'])
+    return results
+
+
+def getCaseName(result):
+    return "/".join(str(result[key]) for key in ['engine', 'timeStep', 'duration', 'members'])
+
+
+def saveResults(results, fileName=BASELINE_FILE):
+    report = {'date': pd.Timestamp.now().isoformat(timespec='seconds'),
+              'machine': platform.machine(), 'python': platform.python_version(),
+              'numpy': np.__version__, 'numba': rainbo.NUMBA_AVAILABLE,
+              'results': results}
+    with open(fileName, 'w') as outputFile:
+        json.dump(report, outputFile, indent=1)
+
+
+# ratio of steps/second to the baseline for the cases in both, and the list of regressions
+def compareResults(results, fileName=BASELINE_FILE, tolerance=REGRESSION_TOLERANCE):
+    with open(fileName) as baselineFile:
+        baseline = {getCaseName(result): result for result in json.load(baselineFile)['results']}
+
+    ratios = {}
+    regressions = []
+    for result in results:
+        name = getCaseName(result)
+        if name in baseline:
+            ratios[name] = result['stepsPerSecond'] / baseline[name]['stepsPerSecond']
+            if ratios[name] < 1 - tolerance:
+                regressions.append(name)
+    return ratios, regressions
+
+
+def main():
+    engines = list(MAX_STEPS) + ['validation']
+    parser = argparse.ArgumentParser(description="Criteria-Rainbo benchmark on synthetic rainfall")
+    parser.add_argument('--engines', nargs='+', default=engines, choices=engines)
+    parser.add_argument('--basin', default='QUADERNA', help="basin name in basins.json")
+    parser.add_argument('--time-steps', nargs='+', default=list(TIME_STEPS), choices=list(TIME_STEPS))
+    parser.add_argument('--durations', nargs='+', default=list(DURATIONS), choices=list(DURATIONS))
+    parser.add_argument('--members', nargs='+', type=int, default=ENSEMBLE_SIZES, help="ensemble sizes")
+    parser.add_argument('--quick', action='store_true', help="only the series of one day and one month")
+    parser.add_argument('--repeat', type=int, default=1, help="timing repetitions (the best is kept)")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline results file")
+    parser.add_argument('--save-baseline', action='store_true', help="overwrite the baseline with the results")
+    parser.add_argument('--output', default=None, help="json file of the results")
+    args = parser.parse_args()
+
+    durations = QUICK_DURATIONS if args.quick else args.durations
+    results = runBenchmark(args.engines, args.basin, args.time_steps, durations, args.members, args.repeat)
+    if args.output is not None:
+        saveResults(results, args.output)
+
+    if args.save_baseline:
+        saveResults(results, args.baseline)
+    elif os.path.exists(args.baseline):
+        ratios, regressions = compareResults(results, args.baseline)
+        for name, ratio in ratios.items():
+            print(name, "\tspeed vs baseline: ", round(ratio, 2))
+        if len(regressions) > 0:
+            print("Regressions: ", ", ".join(regressions))
+
+
+if __name__ == '__main__':
+    main()
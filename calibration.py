@@ -0,0 +1,157 @@
+# calibration of the basin parameters against the observed events of INPUT/<BASIN>/
+# candidate parameter sets are evaluated together as members of an ensemble (runEnsemble),
+# the events are evaluated in parallel and kept in memory between iterations
+# the objective uses the RMSE of the shifted estimate, as the validation scores (scores.computeScores)
+
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import differential_evolution
+import Criteria_Rainbo_model as rainbo
+import basins
+import deficits
+import events as eventStore
+import scores
+
+PARAMETER_NAMES = ['k', 'swc0', 'hMax', 'zeroIdro', 'infMax', 'infMin', 'alpha']
+
+# default search interval of each parameter
+DEFAULT_BOUNDS = {'k': (0.02, 0.5),
+                  'swc0': (2.0, 60.0),
+                  'hMax': (0.5, 8.0),
+                  'zeroIdro': (-1.0, 1.0),
+                  'infMax': (0.5, 15.0),
+                  'infMin': (0.0, 2.0),
+                  'alpha': (0.02, 0.8)}
+
+# objective value of parameter sets without physical meaning (m <= 0)
+INVALID_SCORE = 1.0e6
+
+# in memory cache {basinName: list of events}
+_events = {}
+
+
+# read the events of a basin from the event store: list of dictionaries with dates, precipitation,
+# observed level, initial deficits, time steps in one hour and default shift [hours] of the scores
+def loadEvents(basinName):
+    if basinName in _events:
+        return _events[basinName]
+
+    settings = basins.getBasin(basinName)
+    dailyDeficits = deficits.loadDailyDeficits(settings['criteriaOutputFileName'])
+    store = eventStore.loadEventStore(basinName)
+    events = []
+    for eventIndex in range(eventStore.getNrEvents(store)):
+        event = eventStore.getEvent(store, eventIndex)
+        if np.isnan(event['observed']).all():
+            continue
+        event['deficit35'], event['deficit90'] = deficits.getInitialDeficits(dailyDeficits, event['dates'][0])
+        event['nrIntervals'] = int(3600 / (event['dates'][1] - event['dates'][0]).total_seconds())
+        event['shiftDefault'] = settings['shiftDefault']
+        events.append(event)
+
+    _events[basinName] = events
+    return events
+
+
+# record of parameter arrays: one member for each column of candidates (names x members)
+def getCandidateParameters(basinName, names, candidates):
+    values = dict(basins.getBasin(basinName)['parameterValues'])
+    for i, name in enumerate(names):
+        values[name] = np.asarray(candidates[i], dtype=float)
+    return rainbo.makeBasinParameters(**values)
+
+
+# shifted RMSE [m] (scores.computeShiftedRmse) and peak error [m] (maximum estimated - maximum observed level)
+# of each candidate on one event
+def evaluateEvent(event, parameters):
+    isObserved = ~np.isnan(event['observed'])
+    times = event['dates'].values[isObserved]
+    observed = event['observed'][isObserved]
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        estLevel, _, _ = rainbo.runEnsemble(parameters, event['dates'], event['precipitation'],
+                                            event['deficit35'], event['deficit90'])
+        estimated = estLevel[:, isObserved]
+        rmse = np.array([scores.computeShiftedRmse(times, observed, member, event['nrIntervals'],
+                                                   event['shiftDefault']) for member in estimated])
+    peakError = estimated.max(axis=1) - observed.max()
+    return rmse, peakError
+
+
+def _evaluateEventIndex(basinName, eventIndex, names, candidates):
+    event = loadEvents(basinName)[eventIndex]
+    return evaluateEvent(event, getCandidateParameters(basinName, names, candidates))
+
+
+# mean RMSE + peakWeight * mean absolute peak error over all the events, for each column of candidates
+def computeObjective(candidates, basinName, names, peakWeight=1.0, executor=None):
+    candidates = np.atleast_2d(np.asarray(candidates, dtype=float).T).T
+    nrEvents = len(loadEvents(basinName))
+    arguments = ([basinName] * nrEvents, range(nrEvents), [names] * nrEvents, [candidates] * nrEvents)
+    if executor is None:
+        results = list(map(_evaluateEventIndex, *arguments))
+    else:
+        results = list(executor.map(_evaluateEventIndex, *arguments))
+
+    rmse = np.mean([eventRmse for eventRmse, _ in results], axis=0)
+    peakError = np.mean([np.abs(eventPeakError) for _, eventPeakError in results], axis=0)
+    score = rmse + peakWeight * peakError
+
+    parameters = getCandidateParameters(basinName, names, candidates)
+    isValid = np.broadcast_to(parameters.m > 0, score.shape)
+    return np.where(isValid & np.isfinite(score), score, INVALID_SCORE)
+
+
+# calibrate the parameters names of a basin with differential evolution, starting from the values of basins.json
+# the whole population is evaluated at each iteration as one ensemble for each event
+# returns the BasinParameters record of the best set, the dictionary of calibrated values, the objective
+# and the objective of the initial values: the initial values are returned if the search does not improve them
+def calibrate(basinName, names=PARAMETER_NAMES, bounds=None, nrWorkers=1, peakWeight=1.0,
+              maxIterations=100, populationSize=20, seed=None):
+    bounds = dict(DEFAULT_BOUNDS, **(bounds or {}))
+    loadEvents(basinName)
+    initialValues = [basins.getBasin(basinName)['parameterValues'][name] for name in names]
+    initialScore = float(computeObjective(initialValues, basinName, names, peakWeight)[0])
+    x0 = [np.clip(value, *bounds[name]) for name, value in zip(names, initialValues)]
+
+    executor = None
+    if nrWorkers > 1:
+        executor = ProcessPoolExecutor(max_workers=nrWorkers, initializer=loadEvents, initargs=(basinName,))
+    try:
+        result = differential_evolution(computeObjective, [bounds[name] for name in names],
+                                        args=(basinName, names, peakWeight, executor),
+                                        maxiter=maxIterations, popsize=populationSize, seed=seed, x0=x0,
+                                        vectorized=True, updating='deferred', polish=False)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    bestValues, score = result.x, float(result.fun)
+    if score >= initialScore:
+        bestValues, score = initialValues, initialScore
+    values = {name: float(value) for name, value in zip(names, bestValues)}
+    parameters = getCandidateParameters(basinName, names, bestValues)
+    return rainbo.BasinParameters(*[float(value) for value in parameters]), values, score, initialScore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Criteria-Rainbo calibration of the basin parameters")
+    parser.add_argument('basin', help="basin name in basins.json (e.g. QUADERNA)")
+    parser.add_argument('--parameters', nargs='+', default=PARAMETER_NAMES, choices=PARAMETER_NAMES,
+                        help="parameters to calibrate")
+    parser.add_argument('--workers', type=int, default=1, help="number of parallel processes")
+    parser.add_argument('--iterations', type=int, default=100, help="maximum number of generations")
+    parser.add_argument('--population', type=int, default=20, help="population size multiplier")
+    parser.add_argument('--peak-weight', type=float, default=1.0, help="weight of the peak error")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    _, values, score, initialScore = calibrate(args.basin, args.parameters, None, args.workers,
+                                               args.peak_weight, args.iterations, args.population, args.seed)
+    print("Objective: ", round(initialScore, 4), "->", round(score, 4))
+    print(json.dumps(values, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# daily checkpoints of the soil state of Criteria-Rainbo model (swc, deficit90, leaf interception)
+# the states at the last time step of each day are saved in an indexed .npz file, sorted by time:
+# a run can resume from the nearest checkpoint before its start date instead of the start of the series
+# the file is identified by a key of the soil parameters, initial deficits and start of the series: it is
+# invalidated when they change; the level parameters (sigmoid) are downstream of the soil state and not in the key
+# each checkpoint stores a digest of the rainfall series up to it (hash chained day by day on times and values):
+# any change of the rainfall before a checkpoint invalidates it
+
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import Criteria_Rainbo_model as rainbo
+import basins
+import deficits
+from continuous import getDayNumbers
+
+# changes of the soil model invalidate the existing files
+CHECKPOINT_VERSION = 2
+
+FIELDS = ['time', 'swc', 'deficit90', 'leafIntercepted', 'rainfallDigest']
+FIELD_TYPES = {'time': np.int64, 'rainfallDigest': '<U40'}
+
+
+# key of the file: hash of the soil parameters (alpha, infMax, infMin), initial deficits and start of the series
+def getStateKey(basin, deficit35, deficit90, startDate):
+    basin = rainbo.getParameters(basin)
+    values = [CHECKPOINT_VERSION, float(basin.alpha), float(basin.infMax), float(basin.infMin),
+              float(deficit35), float(deficit90), pd.Timestamp(startDate).isoformat()]
+    return hashlib.sha1(json.dumps(values).encode()).hexdigest()
+
+
+# checkpoints of a file: dictionary of arrays, empty if the file is missing or has a different key
+def loadCheckpoints(fileName, key):
+    if os.path.exists(fileName):
+        with np.load(fileName) as data:
+            if str(data['key']) == key:
+                return {field: data[field] for field in FIELDS}
+    return {field: np.zeros(0, dtype=FIELD_TYPES.get(field, float)) for field in FIELDS}
+
+
+def saveCheckpoints(fileName, key, checkpoints):
+    directory = os.path.dirname(fileName)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmpFileName = fileName + ".tmp"
+    with open(tmpFileName, 'wb') as checkpointFile:
+        np.savez(checkpointFile, key=key, **checkpoints)
+    os.replace(tmpFileName, fileName)
+
+
+# positions of the last time step of each day of a series (the last one of the series only if it ends the day)
+def getDailyIndex(dates):
+    dayNumbers = getDayNumbers(dates)
+    return np.flatnonzero(np.diff(dayNumbers) != 0)
+
+
+# digests of the rainfall series up to each position of dailyIndex: sha1 chained day by day,
+# each digest depends on the times and values of all the previous time steps
+def getRainfallDigests(dates, precipitation, dailyIndex):
+    times = np.asarray(dates.asi8, dtype=np.int64)
+    digests = []
+    digest = b''
+    first = 0
+    for last in dailyIndex + 1:
+        digest = hashlib.sha1(digest + times[first:last].tobytes() + precipitation[first:last].tobytes()).digest()
+        digests.append(digest.hex())
+        first = last
+    return np.array(digests, dtype=FIELD_TYPES['rainfallDigest'])
+
+
+# position of the first time step at or after startDate (in the time zone of the series if without one)
+def getStartIndex(dates, startDate):
+    startDate = pd.Timestamp(startDate)
+    if startDate.tz is None and dates.tz is not None:
+        startDate = startDate.tz_localize(dates.tz)
+    return int(dates.searchsorted(startDate))
+
+
+# position of the time step after the nearest valid checkpoint before startIndex (0 if none) and its state
+# a checkpoint is valid if its time is the end of a day of the series and the rainfall digest up to it is unchanged
+# dailyIndex, digests: positions of the ends of the days of the series and their rainfall digests
+def findCheckpoint(checkpoints, dates, dailyIndex, digests, startIndex):
+    dayEnds = np.asarray(dates.asi8)[dailyIndex]
+    days = np.searchsorted(dayEnds, checkpoints['time'])
+    isValid = days < len(dayEnds)
+    isValid[isValid] = dayEnds[days[isValid]] == checkpoints['time'][isValid]
+    positions = np.zeros(len(days), dtype=np.int64)
+    positions[isValid] = dailyIndex[days[isValid]]
+    isValid &= positions < startIndex
+    isValid[isValid] = digests[days[isValid]] == checkpoints['rainfallDigest'][isValid]
+    if not isValid.any():
+        return 0, None
+    i = np.flatnonzero(isValid)[-1]
+    return int(positions[i]) + 1, (checkpoints['swc'][i], checkpoints['deficit90'][i],
+                                   checkpoints['leafIntercepted'][i])
+
+
+# simulation of a series from startDate, resuming from the nearest checkpoint of the file
+# the checkpoints of the simulated days are added to the file (the later ones are replaced)
+# returns the position of the first simulated time step and the estimated level [m], swc [mm] and WHC90 [mm]
+# from that position: the results are the same of a run from the start of the series
+def runCheckpointed(basin, dates, precipitation, deficit35, deficit90, fileName, startDate=None,
+                    levelMethod=rainbo.LEVEL_EXACT):
+    dates = pd.DatetimeIndex(dates)
+    precipitation = np.asarray(precipitation, dtype=float)
+    key = getStateKey(basin, deficit35, deficit90, dates[0])
+    checkpoints = loadCheckpoints(fileName, key)
+    dailyIndex = getDailyIndex(dates)
+    digests = getRainfallDigests(dates, precipitation, dailyIndex)
+
+    startIndex = 0 if startDate is None else getStartIndex(dates, startDate)
+    firstIndex, state = findCheckpoint(checkpoints, dates, dailyIndex, digests, startIndex)
+    if state is None:
+        # [mm] initial water storages (swc: surface and first soil layer)
+        state = (min(-deficit35, 0), deficit90, 0)
+    swc, currentWHC90, leafIntercepted = state
+
+    timeSteps = rainbo.getTimeSteps(dates)
+    maxStorage = rainbo.maxCropInterceptionSeries(dates)
+    swcout = np.zeros(len(dates) - firstIndex)
+    whc90out = np.zeros(len(dates) - firstIndex)
+
+    # one kernel run for each day, to save the leaf interception at the end of the day
+    isSimulated = dailyIndex >= firstIndex
+    digests = digests[isSimulated]
+    dailyIndex = dailyIndex[isSimulated]
+    newCheckpoints = {field: [] for field in FIELDS}
+    starts = np.concatenate([[firstIndex], dailyIndex + 1])
+    ends = np.append(dailyIndex + 1, len(dates))
+    for i, (first, last) in enumerate(zip(starts, ends)):
+        if last == first:
+            continue
+        _, swcDay, whc90Day, leafIntercepted = \
+            rainbo.runSoilWaterKernel(basin, precipitation[first:last], maxStorage[first:last],
+                                      timeSteps[first:last], swc, currentWHC90, leafIntercepted)
+        swc, currentWHC90 = swcDay[-1], whc90Day[-1]
+        swcout[first - firstIndex:last - firstIndex] = swcDay
+        whc90out[first - firstIndex:last - firstIndex] = whc90Day
+        if i < len(dailyIndex):
+            for field, value in zip(FIELDS, [dates.asi8[last - 1], swc, currentWHC90, leafIntercepted,
+                                             digests[i]]):
+                newCheckpoints[field].append(value)
+
+    if len(newCheckpoints['time']) > 0:
+        isKept = checkpoints['time'] < newCheckpoints['time'][0]
+        checkpoints = {field: np.concatenate([checkpoints[field][isKept],
+                                              np.array(newCheckpoints[field], dtype=checkpoints[field].dtype)])
+                       for field in FIELDS}
+        saveCheckpoints(fileName, key, checkpoints)
+
+    estLevel = rainbo.computeLevels(basin, swcout, levelMethod)
+    return firstIndex, estLevel, swcout, whc90out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Criteria-Rainbo simulation resumed from daily checkpoints")
+    parser.add_argument('basin', help="basin name in basins.json (e.g. QUADERNA)")
+    parser.add_argument('rainfall', help="rainfall csv file (Dataf and precipitation columns)")
+    parser.add_argument('output', help="output csv file, from the start date")
+    parser.add_argument('--checkpoints', required=True, help="checkpoint file (npz)")
+    parser.add_argument('--start', default=None, help="first date of the output (default: start of the series)")
+    parser.add_argument('--deficit35', type=float, default=None, help="[mm] initial deficit35 (default: CRITERIA1D)")
+    parser.add_argument('--deficit90', type=float, default=None, help="[mm] initial deficit90 (default: CRITERIA1D)")
+    args = parser.parse_args()
+
+    settings = basins.getBasin(args.basin)
+    df_in = pd.read_csv(args.rainfall)
+    dates = pd.DatetimeIndex(pd.to_datetime(df_in['Dataf']))
+    deficit35, deficit90 = args.deficit35, args.deficit90
+    if deficit35 is None or deficit90 is None:
+        dailyDeficits = deficits.loadDailyDeficits(settings['criteriaOutputFileName'])
+        deficit35, deficit90 = deficits.getInitialDeficits(dailyDeficits, dates[0])
+
+    firstIndex, estLevel, swcout, whc90out = runCheckpointed(settings['parameters'], dates,
+                                                             df_in[settings['precName']].values,
+                                                             deficit35, deficit90, args.checkpoints, args.start)
+    df_out = pd.DataFrame({'estLevel': estLevel, 'swc': swcout, 'WHC90': whc90out}, index=dates[firstIndex:])
+    df_out.index.name = 'Dataf'
+    if args.start is not None:
+        df_out = df_out.iloc[getStartIndex(dates, args.start) - firstIndex:]
+    df_out.to_csv(args.output)
+    print("Resumed from: ", dates[firstIndex], "\tsimulated time steps: ", len(estLevel),
+          "\tOutput file: ", args.output)
+
+
+if __name__ == '__main__':
+    main()
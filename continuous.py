@@ -0,0 +1,158 @@
+# continuous simulation of Criteria-Rainbo model over long rainfall series:
+# at each day change the soil state is re-initialised with the daily CRITERIA1D deficits of the previous day
+# the series is processed one chunk at a time, the state is carried from a chunk to the next
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import basins
+import deficits
+from realtime import CreekState
+
+
+# day numbers (days since 1970-01-01) of the local dates of a DatetimeIndex
+def getDayNumbers(dates):
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    return dates.values.astype('datetime64[D]').astype(np.int64)
+
+
+# [mm] deficits at the end of a day, None if the day is missing in the daily table
+def _getEndOfDayDeficits(dailyDeficits, day):
+    days = dailyDeficits['days']
+    index = int(np.searchsorted(days, day))
+    if index >= len(days) or days[index] != day:
+        return None
+    return dailyDeficits['DEFICIT_35'][index], dailyDeficits['DEFICIT_90'][index]
+
+
+# simulate one chunk of the series
+# dates: DatetimeIndex of the chunk, precipitation: [mm] rainfall of the chunk
+# dailyDeficits: daily table (deficits.loadDailyDeficits), None to simulate without re-initialisation
+# state: CreekState at the end of the previous chunk, None to start from the deficits of the previous day
+# resetInterception: empty the vegetation storage at each day change
+# returns the state at the end of the chunk and the series of estimated level [m], swc [mm] and WHC90 [mm]
+def creekContinuous(basin, dates, precipitation, dailyDeficits, state=None, resetInterception=True):
+    dates = pd.DatetimeIndex(dates)
+    precipitation = np.asarray(precipitation, dtype=float)
+    nrData = len(precipitation)
+    dayNumbers = getDayNumbers(dates)
+
+    if state is None:
+        if dailyDeficits is None:
+            raise ValueError("an initial state is required without daily deficits")
+        timeStep = (dates[1] - dates[0]).total_seconds()
+        deficit35, deficit90 = deficits.getInitialDeficits(dailyDeficits, dates[0])
+        state = CreekState(basin, timeStep, deficit35, deficit90)
+        previousDay = dayNumbers[0]
+    else:
+        previousDay = getDayNumbers(pd.DatetimeIndex([state.timestamp]))[0]
+
+    estLevel = np.zeros(nrData)
+    swcout = np.zeros(nrData)
+    whc90out = np.zeros(nrData)
+
+    # positions of the day changes in the chunk
+    isNewDay = np.diff(dayNumbers, prepend=previousDay) != 0
+    boundaries = np.append(np.flatnonzero(isNewDay), nrData)
+    if len(boundaries) == 0 or boundaries[0] != 0:
+        boundaries = np.insert(boundaries, 0, 0)
+
+    for first, last in zip(boundaries[:-1], boundaries[1:]):
+        if isNewDay[first] and dailyDeficits is not None:
+            dailyValues = _getEndOfDayDeficits(dailyDeficits, dayNumbers[first] - 1)
+            # missing days: the simulated state is kept
+            if dailyValues is not None:
+                state.resync(dailyValues[0], dailyValues[1], resetInterception)
+        estLevel[first:last], swcout[first:last], whc90out[first:last] = \
+            state.run(precipitation[first:last], dates[first:last])
+
+    return state, estLevel, swcout, whc90out
+
+
+# generator over chunks of (dates, precipitation): yields (dates, estimated level, swc, WHC90) of each chunk
+def iterateContinuous(basin, chunks, dailyDeficits, state=None, resetInterception=True):
+    for dates, precipitation in chunks:
+        if len(precipitation) == 0:
+            continue
+        state, estLevel, swcout, whc90out = creekContinuous(basin, dates, precipitation, dailyDeficits,
+                                                           state, resetInterception)
+        yield dates, estLevel, swcout, whc90out
+
+
+# generator over the chunks of a rainfall csv file: yields (dates, precipitation [mm])
+def readRainfallChunks(fileName, precName, timeName='Dataf', chunkSize=100000):
+    for df_chunk in pd.read_csv(fileName, usecols=[timeName, precName], chunksize=chunkSize):
+        yield pd.DatetimeIndex(pd.to_datetime(df_chunk[timeName])), df_chunk[precName].values
+
+
+# write one chunk of results to a csv file: the first chunk creates the file with the header
+def writeChunk(outputFileName, dates, estLevel, swcout, whc90out, isFirst, timeName='Dataf'):
+    df_out = pd.DataFrame({'estLevel': estLevel, 'swc': swcout, 'WHC90': whc90out}, index=dates)
+    df_out.index.name = timeName
+    df_out.to_csv(outputFileName, mode='w' if isFirst else 'a', header=isFirst)
+
+
+# out-of-core simulation of a rainfall archive: read, simulate and write one chunk at a time
+# stateFileName: CreekState file to resume from (if it exists), saved after each written chunk:
+# a restart after a failure resumes after the last chunk of the output file
+# returns the number of processed time steps
+def runArchive(basin, rainfallFileName, outputFileName, precName, dailyDeficits, chunkSize=100000,
+               state=None, stateFileName=None, resetInterception=True):
+    isFirst = True
+    if stateFileName is not None and os.path.exists(stateFileName):
+        state = CreekState.load(stateFileName)
+        isFirst = not os.path.exists(outputFileName)
+
+    nrData = 0
+    for dates, precipitation in readRainfallChunks(rainfallFileName, precName, chunkSize=chunkSize):
+        if state is not None and state.timestamp is not None:
+            # skip the data already processed before a restart
+            isNew = dates > state.timestamp
+            dates, precipitation = dates[isNew], precipitation[isNew]
+        if len(precipitation) == 0:
+            continue
+        state, estLevel, swcout, whc90out = creekContinuous(basin, dates, precipitation, dailyDeficits,
+                                                           state, resetInterception)
+        writeChunk(outputFileName, dates, estLevel, swcout, whc90out, isFirst)
+        if stateFileName is not None:
+            state.save(stateFileName)
+        isFirst = False
+        nrData += len(precipitation)
+    return nrData
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Criteria-Rainbo continuous simulation of a rainfall archive")
+    parser.add_argument('basin', help="basin name in basins.json (e.g. RAVONE)")
+    parser.add_argument('rainfall', help="rainfall csv file (Dataf and precipitation columns)")
+    parser.add_argument('output', help="output csv file")
+    parser.add_argument('--prec-name', default=None, help="precipitation column (default from basins.json)")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="time steps read at a time")
+    parser.add_argument('--state', default=None, help="state file to resume from and to update")
+    parser.add_argument('--no-resync', action='store_true', help="no daily re-initialisation of the soil state")
+    parser.add_argument('--deficit35', type=float, default=None, help="[mm] initial deficit35 with --no-resync")
+    parser.add_argument('--deficit90', type=float, default=None, help="[mm] initial deficit90 with --no-resync")
+    args = parser.parse_args()
+
+    settings = basins.getBasin(args.basin)
+    precName = args.prec_name or settings['precName']
+    dailyDeficits = None
+    state = None
+    if not args.no_resync:
+        dailyDeficits = deficits.loadDailyDeficits(settings['criteriaOutputFileName'])
+    elif args.state is None or not os.path.exists(args.state):
+        if args.deficit35 is None or args.deficit90 is None:
+            parser.error("--no-resync requires --deficit35 and --deficit90 (or an existing --state)")
+        firstDates, _ = next(readRainfallChunks(args.rainfall, precName, chunkSize=2))
+        timeStep = (firstDates[1] - firstDates[0]).total_seconds()
+        state = CreekState(settings['parameters'], timeStep, args.deficit35, args.deficit90)
+
+    nrData = runArchive(settings['parameters'], args.rainfall, args.output, precName, dailyDeficits,
+                        args.chunk_size, state, args.state)
+    print("Time steps: ", nrData, "\tOutput file: ", args.output)
+
+
+if __name__ == '__main__':
+    main()
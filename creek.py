@@ -0,0 +1,100 @@
+# command line of Criteria-Rainbo model: python creek.py <command> [options]
+#   run: simulation of events, validate: scores and figures of observed events,
+#   scenarios: sensitivity of events to the initial soil state, forecast: probabilistic forecast of a rainfall ensemble
+# the modules of each command are imported when the command runs: the commands without figures
+# do not load matplotlib and scipy
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+COMMANDS = ['run', 'validate', 'scenarios', 'forecast']
+DESCRIPTIONS = {'run': "Criteria-Rainbo simulation of events",
+                'validate': "Criteria-Rainbo validation on observed events",
+                'scenarios': "Criteria-Rainbo sensitivity of events to the initial soil state",
+                'forecast': "Criteria-Rainbo probabilistic forecast of a rainfall ensemble"}
+
+
+# simulation of one event with the initial deficits of the day before, the output table is written in outputPath
+# returns the name of the output file
+def runEvent(settings, fileName, engine, outputPath, tableFormat='csv'):
+    import Criteria_Rainbo_model as rainbo
+    import deficits
+    import events as eventStore
+
+    precName = settings['precName']
+    df_in = eventStore.readEventCsv(fileName)
+
+    dailyDeficits = deficits.loadDailyDeficits(settings['criteriaOutputFileName'])
+    deficit35, deficit90 = deficits.getInitialDeficits(dailyDeficits, df_in.index[0])
+    df_out = rainbo.creek(settings['parameters'], df_in, precName, deficit35, deficit90, engine=engine)
+
+    columns = [name for name in [precName, 'WHC90', 'swc', 'estLevel', eventStore.LEVEL_NAME] if name in df_out]
+    outputFileName = os.path.join(outputPath, "Run_" + os.path.splitext(os.path.basename(fileName))[0])
+    return eventStore.writeTable(df_out[columns], outputFileName, tableFormat)
+
+
+def addRunArguments(parser):
+    parser.add_argument('--basin', default='QUADERNA', help="basin name in basins.json (e.g. QUADERNA)")
+    parser.add_argument('events', nargs='*', help="event files or glob patterns (default: all the events of the basin)")
+    parser.add_argument('--engine', default='kernel', choices=['reference', 'kernel'])
+    parser.add_argument('--output-path', default=None, help="output directory (default: outputPath of the basin)")
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet', 'json'],
+                        help="format of the tables (parquet requires pyarrow)")
+    parser.add_argument('--workers', type=int, default=1, help="number of parallel processes")
+
+
+def runCommand(args):
+    import Criteria_Rainbo_model as rainbo
+    import basins
+
+    settings = basins.getBasin(args.basin)
+    fileNames = basins.getEventFiles(settings, args.events)
+    engine = rainbo.KERNEL if args.engine == 'kernel' else rainbo.REFERENCE
+    outputPath = args.output_path or settings['outputPath']
+    nrEvents = len(fileNames)
+    arguments = ([settings] * nrEvents, fileNames, [engine] * nrEvents, [outputPath] * nrEvents,
+                 [args.format] * nrEvents)
+    if args.workers > 1 and nrEvents > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            outputFileNames = list(executor.map(runEvent, *arguments))
+    else:
+        outputFileNames = list(map(runEvent, *arguments))
+    for outputFileName in outputFileNames:
+        print("Output file: ", outputFileName)
+
+
+# module of a command: addArguments(parser) and runCommand(args)
+def getCommandModule(command):
+    if command == 'validate':
+        import validation
+        return validation
+    if command == 'scenarios':
+        import Scenarios
+        return Scenarios
+    if command == 'forecast':
+        import forecast
+        return forecast
+    raise KeyError("unknown command: " + command)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='creek', description="Criteria-Rainbo model",
+                                     epilog="options of a command: creek <command> --help")
+    parser.add_argument('command', choices=COMMANDS)
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help="options of the command")
+    args = parser.parse_args(arguments)
+
+    # only the module of the selected command is imported
+    commandParser = argparse.ArgumentParser(prog='creek ' + args.command, description=DESCRIPTIONS[args.command])
+    if args.command == 'run':
+        addRunArguments(commandParser)
+        runCommand(commandParser.parse_args(args.arguments))
+    else:
+        module = getCommandModule(args.command)
+        module.addArguments(commandParser)
+        module.runCommand(commandParser.parse_args(args.arguments))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# daily water deficits computed by CRITERIA1D (CriteriaOutput/*.csv)
+# the csv is parsed once and cached in a binary .npz file, rebuilt when the csv changes
+
+import os
+import numpy as np
+import pandas as pd
+
+# in memory cache {criteriaOutputFileName: (mtime, dailyDeficits)}
+_loaded = {}
+
+
+def _getCacheFileName(criteriaOutputFileName):
+    return os.path.splitext(criteriaOutputFileName)[0] + ".npz"
+
+
+def _readCsv(criteriaOutputFileName):
+    df_daily = pd.read_csv(criteriaOutputFileName, usecols=['DATE', 'DEFICIT_35', 'DEFICIT_90'])
+    days = pd.to_datetime(df_daily['DATE']).values.astype('datetime64[D]').astype(np.int64)
+    # stable sort: with duplicated dates the first row is kept, as in the original lookup
+    order = np.argsort(days, kind='stable')
+    return {'days': days[order],
+            'DEFICIT_35': df_daily['DEFICIT_35'].values[order].astype(float),
+            'DEFICIT_90': df_daily['DEFICIT_90'].values[order].astype(float)}
+
+
+# load the daily deficits: dictionary of sorted day numbers (days since 1970-01-01) and deficits [mm]
+def loadDailyDeficits(criteriaOutputFileName):
+    mtime = os.path.getmtime(criteriaOutputFileName)
+    if criteriaOutputFileName in _loaded and _loaded[criteriaOutputFileName][0] == mtime:
+        return _loaded[criteriaOutputFileName][1]
+
+    dailyDeficits = None
+    cacheFileName = _getCacheFileName(criteriaOutputFileName)
+    if os.path.exists(cacheFileName):
+        with np.load(cacheFileName) as cache:
+            if cache['mtime'] == mtime:
+                dailyDeficits = {key: cache[key] for key in ['days', 'DEFICIT_35', 'DEFICIT_90']}
+
+    if dailyDeficits is None:
+        dailyDeficits = _readCsv(criteriaOutputFileName)
+        try:
+            tmpFileName = cacheFileName + ".tmp"
+            with open(tmpFileName, 'wb') as cacheFile:
+                np.savez(cacheFile, mtime=mtime, **dailyDeficits)
+            os.replace(tmpFileName, cacheFileName)
+        except OSError:
+            # read-only input directory: work without the disk cache
+            pass
+
+    _loaded[criteriaOutputFileName] = (mtime, dailyDeficits)
+    return dailyDeficits
+
+
+# day number (days since 1970-01-01) of a date
+def getDayNumber(date):
+    return int(np.datetime64(pd.Timestamp(date).strftime("%Y-%m-%d"), 'D').astype(np.int64))
+
+
+# position of a day in the daily deficits, KeyError if missing
+def getDayIndex(dailyDeficits, date):
+    day = getDayNumber(date)
+    days = dailyDeficits['days']
+    index = int(np.searchsorted(days, day))
+    if index >= len(days) or days[index] != day:
+        raise KeyError("missing daily deficit: " + pd.Timestamp(date).strftime("%Y-%m-%d"))
+    return index
+
+
+# [mm] deficits of a day
+def getDailyDeficits(dailyDeficits, date):
+    index = getDayIndex(dailyDeficits, date)
+    return dailyDeficits['DEFICIT_35'][index], dailyDeficits['DEFICIT_90'][index]
+
+
+# [mm] initial deficit35 (not negative) and deficit90 of an event starting at date0: values of the previous day
+def getInitialDeficits(dailyDeficits, date0):
+    deficit35, deficit90 = getDailyDeficits(dailyDeficits, pd.Timestamp(date0) - pd.Timedelta(days=1))
+    return max(deficit35, 0), deficit90
@@ -0,0 +1,134 @@
+# columnar binary store of the observed events of a basin (INPUT/<BASIN>/*.csv)
+# one .npy file for each column, with the events concatenated:
+#   time: [s] int64 epoch time (UTC) of the end of the interval (Dataf)
+#   <precName>: [mm] float32 precipitation
+#   Livello: [m] float32 observed level, nan where missing
+#   offsets: int64 start of each event (and total length)
+# the arrays are memory mapped; the store is rebuilt when the csv files change
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import basins
+
+STORE_DIRECTORY = "EventStore"
+MANIFEST_FILE = "manifest.json"
+TIME_NAME = 'Dataf'
+LEVEL_NAME = 'Livello'
+
+# formats of the output tables (parquet requires pyarrow or fastparquet)
+TABLE_FORMATS = ['csv', 'parquet', 'json']
+
+
+def _getStorePath(settings):
+    return os.path.join(settings['inputPath'], STORE_DIRECTORY)
+
+
+def _getSourceFiles(settings):
+    fileNames = basins.getEventFiles(settings)
+    return [[os.path.basename(fileName), os.path.getmtime(fileName)] for fileName in fileNames]
+
+
+# convert the csv events of a basin into the columnar store
+def ingestEvents(basinName, dtype=np.float32):
+    settings = basins.getBasin(basinName)
+    precName = settings['precName']
+    sourceFiles = _getSourceFiles(settings)
+
+    times = []
+    precipitation = []
+    levels = []
+    offsets = [0]
+    for fileName, _ in sourceFiles:
+        df_in = pd.read_csv(os.path.join(settings['inputPath'], fileName), usecols=[TIME_NAME, precName, LEVEL_NAME])
+        dates = pd.to_datetime(df_in[TIME_NAME], utc=True)
+        times.append(dates.values.astype('datetime64[s]').astype(np.int64))
+        precipitation.append(df_in[precName].values.astype(dtype))
+        levels.append(df_in[LEVEL_NAME].values.astype(dtype))
+        offsets.append(offsets[-1] + len(df_in))
+
+    storePath = _getStorePath(settings)
+    os.makedirs(storePath, exist_ok=True)
+    np.save(os.path.join(storePath, "time.npy"), np.concatenate(times))
+    np.save(os.path.join(storePath, precName + ".npy"), np.concatenate(precipitation))
+    np.save(os.path.join(storePath, LEVEL_NAME + ".npy"), np.concatenate(levels))
+    np.save(os.path.join(storePath, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    # the manifest is written last: an interrupted ingest is rebuilt at the next load
+    with open(os.path.join(storePath, MANIFEST_FILE), 'w') as manifestFile:
+        json.dump({'precName': precName, 'files': sourceFiles}, manifestFile)
+
+
+# memory mapped store of a basin: dictionary of arrays and the list of event file names
+# the store is (re)built if missing or if the csv files have changed
+def loadEventStore(basinName):
+    settings = basins.getBasin(basinName)
+    storePath = _getStorePath(settings)
+    manifestFileName = os.path.join(storePath, MANIFEST_FILE)
+
+    manifest = None
+    if os.path.exists(manifestFileName):
+        with open(manifestFileName) as manifestFile:
+            manifest = json.load(manifestFile)
+    if manifest is None or manifest['files'] != _getSourceFiles(settings) \
+            or manifest['precName'] != settings['precName']:
+        ingestEvents(basinName)
+        with open(manifestFileName) as manifestFile:
+            manifest = json.load(manifestFile)
+
+    precName = manifest['precName']
+    store = {'fileNames': [fileName for fileName, _ in manifest['files']], 'precName': precName}
+    for name in ['time', precName, LEVEL_NAME, 'offsets']:
+        store[name] = np.load(os.path.join(storePath, name + ".npy"), mmap_mode='r')
+    return store
+
+
+# number of events in the store
+def getNrEvents(store):
+    return len(store['offsets']) - 1
+
+
+# position in the store of an event file (name with or without path)
+def getEventIndex(store, fileName):
+    return store['fileNames'].index(os.path.basename(fileName))
+
+
+# arrays of one event: dates (UTC DatetimeIndex), precipitation [mm] and observed level [m]
+def getEvent(store, eventIndex):
+    first, last = store['offsets'][eventIndex], store['offsets'][eventIndex + 1]
+    dates = pd.to_datetime(np.asarray(store['time'][first:last]), unit='s', utc=True)
+    return {'fileName': store['fileNames'][eventIndex],
+            'dates': pd.DatetimeIndex(dates),
+            'precipitation': np.asarray(store[store['precName']][first:last], dtype=float),
+            'observed': np.asarray(store[LEVEL_NAME][first:last], dtype=float)}
+
+
+# event csv file (INPUT/<BASIN>/*.csv) as a DataFrame: index Dataf, the other columns of the file
+def readEventCsv(fileName):
+    df_in = pd.read_csv(fileName)
+    df_in.index = pd.to_datetime(df_in[TIME_NAME])
+    del df_in[TIME_NAME]
+    return df_in
+
+
+# one event as the DataFrame read from the csv: index Dataf, precipitation and Livello columns
+def getEventFrame(store, eventIndex):
+    event = getEvent(store, eventIndex)
+    df_in = pd.DataFrame({store['precName']: event['precipitation'], LEVEL_NAME: event['observed']},
+                         index=event['dates'])
+    df_in.index.name = TIME_NAME
+    return df_in
+
+
+# write an output table: fileName without extension, the extension is the format
+def writeTable(df_out, fileName, tableFormat='csv'):
+    fileName = fileName + "." + tableFormat
+    if tableFormat == 'csv':
+        df_out.to_csv(fileName)
+    elif tableFormat == 'parquet':
+        df_out.to_parquet(fileName)
+    elif tableFormat == 'json':
+        df_out.to_json(fileName, orient='table', date_format='iso')
+    else:
+        raise ValueError("unknown table format: " + tableFormat)
+    return fileName
@@ -0,0 +1,130 @@
+# probabilistic forecast of Criteria-Rainbo model: an ensemble of rainfall scenarios is propagated from the
+# current soil state, all members are advanced together at each time step
+# the level quantiles and the probabilities of exceeding the alarm levels are computed at each time step,
+# without storing the trajectories of the members
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import Criteria_Rainbo_model as rainbo
+import basins
+import deficits
+import events as eventStore
+from realtime import CreekState
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# basin of the forecast when not selected
+DEFAULT_BASIN = 'QUADERNA'
+
+
+# rainfall ensemble of a local file: dates (DatetimeIndex) and [mm] members x time precipitation
+# csv: time column and one column for each member; npz: 'dates' (datetime64) and 'precipitation' arrays
+def readRainfallEnsemble(fileName, timeName='Dataf'):
+    if os.path.splitext(fileName)[1] == '.npz':
+        with np.load(fileName) as data:
+            return pd.DatetimeIndex(data['dates']), np.atleast_2d(data['precipitation']).astype(float)
+
+    df_in = pd.read_csv(fileName)
+    dates = pd.DatetimeIndex(pd.to_datetime(df_in[timeName]))
+    del df_in[timeName]
+    return dates, df_in.values.T.astype(float)
+
+
+# forecast of the ensemble from the state of the basin at the time before dates[0]
+# state: CreekState, precipitation: [mm] members x time rainfall, alarmLevels: [m] thresholds
+# returns a DataFrame indexed by dates with the level quantiles (q<quantile>) and the probabilities of
+# exceeding each alarm level (p<level>), and the probability of crossing each alarm level in the forecast window
+def runForecast(state, dates, precipitation, alarmLevels, quantiles=QUANTILES, levelMethod=rainbo.LEVEL_EXACT):
+    dates = pd.DatetimeIndex(dates)
+    precipitation = np.atleast_2d(np.asarray(precipitation, dtype=float))
+    alarmLevels = np.atleast_1d(np.asarray(alarmLevels, dtype=float))
+    members = rainbo.EnsembleState(state.basin, state.swc, state.deficit90, state.leafIntercepted,
+                                   precipitation.shape[0])
+    nrData = precipitation.shape[1]
+
+    levelQuantiles = np.zeros((nrData, len(quantiles)))
+    exceedance = np.zeros((nrData, len(alarmLevels)))
+    isCrossed = np.zeros((members.nrMembers, len(alarmLevels)), dtype=bool)
+    for j in rainbo.stepEnsemble(members, dates, precipitation):
+        waterLevel = rainbo.computeLevels(members.basin, members.swc, levelMethod)
+        levelQuantiles[j] = np.quantile(waterLevel, quantiles)
+        isAbove = waterLevel[:, np.newaxis] >= alarmLevels
+        exceedance[j] = isAbove.mean(axis=0)
+        isCrossed |= isAbove
+
+    columns = {'q' + str(quantile): levelQuantiles[:, i] for i, quantile in enumerate(quantiles)}
+    for i, alarmLevel in enumerate(alarmLevels):
+        columns['p' + str(alarmLevel)] = exceedance[:, i]
+    df_out = pd.DataFrame(columns, index=dates)
+    return df_out, isCrossed.mean(axis=0)
+
+
+# initial state of a basin before the forecast start: from a CreekState file,
+# or from the daily deficits (criteriaOutput of basins.json) of the day before
+def getInitialState(settings, dates, stateFileName=None):
+    if stateFileName is not None:
+        return CreekState.load(stateFileName)
+    timeStep = (dates[1] - dates[0]).total_seconds()
+    dailyDeficits = deficits.loadDailyDeficits(settings['criteriaOutputFileName'])
+    deficit35, deficit90 = deficits.getInitialDeficits(dailyDeficits, dates[0])
+    return CreekState(settings['parameters'], timeStep, deficit35, deficit90)
+
+
+# forecast of one rainfall ensemble file, the table of quantiles and exceedance probabilities is written
+# in outputPath (Forecast_<file name>)
+# returns the name of the output file, the number of members and the probability of crossing each alarm level
+def forecastFile(settings, fileName, stateFileName=None, timeName='Dataf', quantiles=QUANTILES, outputPath=None,
+                 tableFormat='csv'):
+    dates, precipitation = readRainfallEnsemble(fileName, timeName)
+    state = getInitialState(settings, dates, stateFileName)
+    df_out, crossingProbability = runForecast(state, dates, precipitation, settings['alarmLevels'], quantiles)
+    df_out.index.name = timeName
+
+    outputFileName = os.path.join(outputPath or settings['outputPath'],
+                                  "Forecast_" + os.path.splitext(os.path.basename(fileName))[0])
+    return eventStore.writeTable(df_out, outputFileName, tableFormat), precipitation.shape[0], crossingProbability
+
+
+# command line arguments of the forecast (also used by the forecast command of creek.py)
+def addArguments(parser):
+    parser.add_argument('--basin', default=DEFAULT_BASIN, help="basin name in basins.json (e.g. QUADERNA)")
+    parser.add_argument('rainfall', nargs='+',
+                        help="rainfall ensemble files or glob patterns: csv (time and member columns) or npz")
+    parser.add_argument('--state', default=None, help="CreekState file of the current state")
+    parser.add_argument('--time-name', default='Dataf', help="time column of the csv")
+    parser.add_argument('--quantiles', nargs='+', type=float, default=QUANTILES)
+    parser.add_argument('--output-path', default=None, help="output directory (default: outputPath of the basin)")
+    parser.add_argument('--format', default='csv', choices=eventStore.TABLE_FORMATS,
+                        help="format of the tables (parquet requires pyarrow)")
+    parser.add_argument('--workers', type=int, default=1, help="number of parallel processes")
+
+
+def runCommand(args):
+    settings = basins.getBasin(args.basin)
+    fileNames = basins.getEventFiles(settings, args.rainfall)
+    nrFiles = len(fileNames)
+    arguments = ([settings] * nrFiles, fileNames, [args.state] * nrFiles, [args.time_name] * nrFiles,
+                 [args.quantiles] * nrFiles, [args.output_path] * nrFiles, [args.format] * nrFiles)
+    if args.workers > 1 and nrFiles > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(forecastFile, *arguments))
+    else:
+        results = list(map(forecastFile, *arguments))
+
+    for outputFileName, nrMembers, crossingProbability in results:
+        print("Members: ", nrMembers, "\tOutput file: ", outputFileName)
+        for alarmLevel, probability in zip(settings['alarmLevels'], crossingProbability):
+            print("Alarm level: ", alarmLevel, "\tprobability of crossing: ", round(probability, 3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Criteria-Rainbo probabilistic forecast of a rainfall ensemble")
+    addArguments(parser)
+    runCommand(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
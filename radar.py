@@ -0,0 +1,159 @@
+# basin rainfall of gridded radar composites: local files of frames (NetCDF, GeoTIFF, npz or npy arrays)
+# the basins are rows of a sparse weight matrix (basins x grid cells), precomputed from the fraction of each cell
+# inside each basin: one sparse product for each frame extracts the mean rainfall of all the basins
+# the basin series are resampled on the time step of the model (P15, P30) with resample.normalizeRainfall
+# xarray (NetCDF) and rasterio (GeoTIFF) are required only to read those formats
+
+import argparse
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import Criteria_Rainbo_model as rainbo
+import basins
+import resample
+
+UNIT_MM = 'mm'          # frames of rainfall accumulated in the interval before the frame time
+UNIT_RATE = 'mm/h'      # frames of rainfall intensity
+
+# minimum fraction of the weight of a basin on valid (not nan) cells, the basin rainfall is nan below
+MIN_COVERAGE = 0.5
+
+
+# sparse weight matrix of masks of the basins (2D arrays of the fraction of each cell inside the basin)
+# the rows are normalised: the product with a frame is the weighted mean rainfall of each basin
+def makeWeights(masks):
+    masks = np.array([np.asarray(mask, dtype=float).ravel() for mask in masks])
+    total = masks.sum(axis=1, keepdims=True)
+    if (total <= 0).any():
+        raise ValueError("empty basin mask")
+    return sparse.csr_matrix(masks / total)
+
+
+# weight file (npz): basin names, grid shape and the arrays of the sparse matrix
+def saveWeights(fileName, weights, basinNames, gridShape):
+    weights = sparse.csr_matrix(weights)
+    np.savez(fileName, data=weights.data, indices=weights.indices, indptr=weights.indptr,
+             shape=np.array(weights.shape), gridShape=np.array(gridShape), basinNames=np.array(basinNames))
+
+
+# weight matrix, basin names and grid shape of a weight file
+def loadWeights(fileName):
+    with np.load(fileName) as data:
+        weights = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+        return weights, [str(name) for name in data['basinNames']], tuple(data['gridShape'])
+
+
+# time of a single frame file, from its name without extension (e.g. dateFormat = "cmp_%Y%m%d%H%M")
+def getFrameTime(fileName, dateFormat):
+    name = os.path.splitext(os.path.basename(fileName))[0]
+    return pd.Timestamp(datetime.strptime(name, dateFormat), tz='UTC')
+
+
+# frames of a radar file: iterator of (time, 2D frame)
+# nc: variable with a 'time' dimension (xarray); npz: 'dates' and 'frames' (time x rows x columns) arrays
+# tif, tiff (first band, rasterio) and npy (2D array): one frame, time from the file name
+def readFrames(fileName, variable=None, dateFormat=None):
+    extension = os.path.splitext(fileName)[1].lower()
+    if extension == '.nc':
+        import xarray as xr
+
+        with xr.open_dataset(fileName) as dataset:
+            data = dataset[variable] if variable is not None else dataset[list(dataset.data_vars)[0]]
+            dates = pd.DatetimeIndex(data['time'].values)
+            for i, date in enumerate(dates):
+                yield date, np.asarray(data.isel(time=i).values, dtype=float)
+    elif extension == '.npz':
+        with np.load(fileName) as data:
+            for date, frame in zip(pd.DatetimeIndex(data['dates']), data['frames']):
+                yield date, np.asarray(frame, dtype=float)
+    elif extension in ('.tif', '.tiff'):
+        import rasterio
+
+        with rasterio.open(fileName) as dataset:
+            frame = dataset.read(1, masked=True).astype(float).filled(np.nan)
+        yield getFrameTime(fileName, dateFormat), frame
+    elif extension == '.npy':
+        yield getFrameTime(fileName, dateFormat), np.load(fileName).astype(float)
+    else:
+        raise ValueError("unknown radar format: " + fileName)
+
+
+# mean rainfall of the basins of one frame: nan cells are excluded (weights renormalised),
+# nan if the valid cells are less than minCoverage of the weight of the basin
+def extractFrame(weights, frame, minCoverage=MIN_COVERAGE):
+    values = np.asarray(frame, dtype=float).ravel()
+    isValid = ~np.isnan(values)
+    # one product for the weighted sum and the valid weight
+    total, coverage = (weights @ np.column_stack([np.where(isValid, values, 0), isValid])).T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(coverage >= minCoverage, total / coverage, np.nan)
+
+
+# basin rainfall [mm] of the frames of the radar files: DataFrame indexed by frame time, one column for each basin
+# the frame times without time zone are UTC
+# the frames in rainfall intensity (UNIT_RATE) are converted with the interval from the previous frame
+def extractBasins(weights, basinNames, fileNames, variable=None, dateFormat=None, unit=UNIT_MM,
+                  minCoverage=MIN_COVERAGE):
+    dates = []
+    rainfall = []
+    for fileName in fileNames:
+        for date, frame in readFrames(fileName, variable, dateFormat):
+            if frame.size != weights.shape[1]:
+                raise ValueError("frame of " + fileName + " does not match the grid of the weights")
+            dates.append(date)
+            rainfall.append(extractFrame(weights, frame, minCoverage))
+
+    df_out = pd.DataFrame(np.array(rainfall).reshape(len(dates), len(basinNames)),
+                          index=pd.DatetimeIndex(dates), columns=basinNames).sort_index()
+    df_out = df_out[~df_out.index.duplicated()]
+    if df_out.index.tz is None:
+        df_out.index = df_out.index.tz_localize('UTC')
+    if unit == UNIT_RATE:
+        df_out = df_out.mul(rainbo.getTimeSteps(df_out.index) / 3600, axis=0)
+    return df_out
+
+
+# basin rainfall [mm] of the frames on the time step [s] of the model
+# missing frames and nan basin values are gaps of resample.normalizeRainfall (gapPolicy)
+def getBasinRainfall(frameRainfall, timeStep, gapPolicy=resample.GAP_ZERO, maxGap=None):
+    return pd.DataFrame({name: resample.normalizeRainfall(frameRainfall[name], timeStep, gapPolicy, maxGap=maxGap)
+                         for name in frameRainfall.columns})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="basin rainfall of gridded radar frames")
+    parser.add_argument('weights', help="weight file (npz) of the basins")
+    parser.add_argument('basin', help="basin name in basins.json and in the weight file (e.g. QUADERNA)")
+    parser.add_argument('frames', nargs='+', help="radar files: nc, npz, tif or npy")
+    parser.add_argument('--output', required=True, help="output csv file (Datai, Dataf, precipitation)")
+    parser.add_argument('--event', default=None, help="event csv file: its precipitation is replaced")
+    parser.add_argument('--variable', default=None, help="variable of the NetCDF files")
+    parser.add_argument('--date-format', default=None, help="time format of the names of single frame files")
+    parser.add_argument('--unit', default=UNIT_MM, choices=[UNIT_MM, UNIT_RATE])
+    parser.add_argument('--gap-policy', default=resample.GAP_ZERO,
+                        choices=[resample.GAP_ZERO, resample.GAP_SPREAD, resample.GAP_NAN, resample.GAP_ERROR])
+    args = parser.parse_args()
+
+    settings = basins.getBasin(args.basin)
+    precName = settings['precName']
+    timeStep = resample.getBasinTimeStep(settings)
+    weights, basinNames, _ = loadWeights(args.weights)
+    frameRainfall = extractBasins(weights, basinNames, args.frames, args.variable, args.date_format, args.unit)
+    rainfall = resample.normalizeRainfall(frameRainfall[settings['name']], timeStep, args.gap_policy)
+
+    if args.event is not None:
+        df_out = pd.read_csv(args.event)
+        dates = pd.DatetimeIndex(pd.to_datetime(df_out[resample.TIME_NAME]))
+        df_out[precName] = rainfall.reindex(dates).values
+    else:
+        df_out = pd.DataFrame({resample.START_NAME: rainfall.index - pd.Timedelta(seconds=timeStep),
+                               resample.TIME_NAME: rainfall.index, precName: rainfall.values})
+    df_out.to_csv(args.output, index=False)
+    print("Frames: ", len(frameRainfall), "\tprecipitation: ", round(np.nansum(df_out[precName]), 2),
+          "\tOutput file: ", args.output)
+
+
+if __name__ == '__main__':
+    main()
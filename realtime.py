@@ -0,0 +1,119 @@
+# real-time stepper of Criteria-Rainbo model: one observation at a time
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import Criteria_Rainbo_model as rainbo
+import assimilation
+
+
+# state of the model between two observations
+# basin: basin name, id or BasinParameters record (resolved once, the original value is kept for snapshot)
+# timeStep: [s] time step of the rainfall feed
+class CreekState:
+    def __init__(self, basin, timeStep, deficit35, deficit90, timestamp=None):
+        self.basinId = basin
+        self.basin = rainbo.getParameters(basin)
+        self.timeStep = float(timeStep)
+        # [mm] current water storages (swc: surface and first soil layer)
+        self.swc = min(-deficit35, 0)
+        self.deficit90 = deficit90
+        self.leafIntercepted = 0
+        # last processed observation
+        self.timestamp = None if timestamp is None else pd.Timestamp(timestamp)
+
+    # advance the state of one observation, returns the estimated water level [m]
+    # the time step is the interval from the last processed observation (timeStep for the first observation)
+    def step(self, rainfall, timestamp):
+        # scalar check of missing rainfall (checkRainfall is for the arrays of the batch engines)
+        if rainfall != rainfall:
+            raise ValueError("missing rainfall (nan) at " + str(timestamp) + ": fill the gaps before the simulation")
+        timestamp = pd.Timestamp(timestamp)
+        timeStep = self.timeStep if self.timestamp is None else (timestamp.value - self.timestamp.value) / 1e9
+        waterLevel, self.swc, self.deficit90, self.leafIntercepted = \
+            rainbo.computeWaterLevel(self.basin, timestamp, timeStep, rainfall,
+                                     self.swc, self.deficit90, self.leafIntercepted)
+        self.timestamp = timestamp
+        return waterLevel
+
+    # advance the state over an array of observations, returns the estimated water levels [m]
+    # timestamps: default consecutive time steps after the last processed observation
+    def step_many(self, rainfall, timestamps=None):
+        estLevel, _, _ = self.run(rainfall, timestamps)
+        return estLevel
+
+    # as step_many, returns the series of estimated level [m], swc [mm] and WHC90 [mm]
+    def run(self, rainfall, timestamps=None):
+        rainfall = np.asarray(rainfall, dtype=float)
+        if len(rainfall) == 0:
+            return np.zeros(0), np.zeros(0), np.zeros(0)
+        if timestamps is None:
+            if self.timestamp is None:
+                raise ValueError("timestamps are required for the first observations")
+            timestamps = self.timestamp + pd.to_timedelta(self.timeStep * np.arange(1, len(rainfall) + 1), unit='s')
+        timestamps = pd.DatetimeIndex(timestamps)
+
+        # [s] interval of each observation from the previous one (timeStep for the first observation)
+        timeSteps = np.full(len(rainfall), self.timeStep)
+        timeSteps[1:] = np.diff(np.asarray(timestamps.asi8)) / 1e9
+        if self.timestamp is not None:
+            timeSteps[0] = (timestamps[0] - self.timestamp).total_seconds()
+
+        maxStorage = rainbo.maxCropInterceptionSeries(timestamps)
+        estLevel, swcout, whc90out, self.leafIntercepted = \
+            rainbo.runSoilWaterKernel(self.basin, rainfall, maxStorage, timeSteps,
+                                      self.swc, self.deficit90, self.leafIntercepted)
+        self.swc = float(swcout[-1])
+        self.deficit90 = float(whc90out[-1])
+        self.timestamp = timestamps[-1]
+        return estLevel, swcout, whc90out
+
+    # re-initialise the soil state with daily deficits [mm]: deficit90 is replaced,
+    # swc only while the surface storage is not full (swc < 0)
+    def resync(self, deficit35, deficit90, resetInterception=False):
+        self.deficit90 = deficit90
+        if self.swc < 0:
+            self.swc = min(-deficit35, 0)
+        if resetInterception:
+            self.leafIntercepted = 0
+
+    # correct swc with an observed level [m] (nudging, see assimilation.nudgeSwc), returns the new swc [mm]
+    def assimilate(self, observedLevel, gain=assimilation.DEFAULT_GAIN):
+        self.swc = float(assimilation.nudgeSwc(self.basin, self.swc, observedLevel, gain))
+        return self.swc
+
+    # current state as a dictionary of plain values
+    def snapshot(self):
+        basin = self.basinId
+        if isinstance(basin, rainbo.BasinParameters):
+            basin = dict(basin._asdict())
+        return {'basin': basin,
+                'timeStep': self.timeStep,
+                'swc': float(self.swc),
+                'deficit90': float(self.deficit90),
+                'leafIntercepted': float(self.leafIntercepted),
+                'timestamp': None if self.timestamp is None else self.timestamp.isoformat()}
+
+    # new state from a snapshot
+    @classmethod
+    def restore(cls, snapshot):
+        basin = snapshot['basin']
+        if isinstance(basin, dict):
+            basin = rainbo.BasinParameters(**basin)
+        state = cls(basin, snapshot['timeStep'], 0, snapshot['deficit90'], snapshot['timestamp'])
+        state.swc = snapshot['swc']
+        state.leafIntercepted = snapshot['leafIntercepted']
+        return state
+
+    # the file is replaced atomically: an interrupted save keeps the previous state
+    def save(self, fileName):
+        tmpFileName = fileName + ".tmp"
+        with open(tmpFileName, 'w') as stateFile:
+            json.dump(self.snapshot(), stateFile)
+        os.replace(tmpFileName, fileName)
+
+    @classmethod
+    def load(cls, fileName):
+        with open(fileName) as stateFile:
+            return cls.restore(json.load(stateFile))
@@ -0,0 +1,202 @@
+# golden-output regression of Criteria-Rainbo engines:
+# estLevel, swc and WHC90 of the reference creek on the observed events of each basin are saved once (snapshot),
+# the alternative engines are then compared with them on the same events (check)
+# the engines are also compared with the reference creek on the events with missing records (irregular time steps)
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import Criteria_Rainbo_model as rainbo
+import basins
+import deficits
+import events as eventStore
+from realtime import CreekState
+
+GOLDEN_DIRECTORY = "Golden"
+GOLDEN_FILE = "reference.npz"
+FIELDS = ['estLevel', 'swc', 'WHC90']
+
+# [m, mm, mm] maximum absolute difference from the reference for each engine and field (default exact)
+TOLERANCES = {'kernel': {},
+              'kernel_table': {'estLevel': rainbo.LEVEL_TABLE_TOLERANCE},
+              'ensemble': {},
+              'realtime': {},
+              'realtime_step': {}}
+
+# missing records of the irregular series: GAP_LENGTH records removed every GAP_STRIDE
+GAP_STRIDE = 40
+GAP_LENGTH = 4
+SERIES_REGULAR = 'regular'
+SERIES_GAPS = 'gaps'
+
+
+def getGoldenFileName(settings):
+    return os.path.join(settings['inputPath'], GOLDEN_DIRECTORY, GOLDEN_FILE)
+
+
+# event csv as in validation: index Dataf, precipitation and Livello columns, and its initial deficits
+def readEvent(settings, fileName):
+    df_in = eventStore.readEventCsv(fileName)
+    dailyDeficits = deficits.loadDailyDeficits(settings['criteriaOutputFileName'])
+    deficit35, deficit90 = deficits.getInitialDeficits(dailyDeficits, df_in.index[0])
+    return df_in, deficit35, deficit90
+
+
+# event with GAP_LENGTH records removed every GAP_STRIDE
+def dropRecords(df_in):
+    return df_in[np.arange(len(df_in)) % GAP_STRIDE < GAP_STRIDE - GAP_LENGTH]
+
+
+def _runCreek(engine, levelMethod):
+    def run(basin, df_in, precName, deficit35, deficit90):
+        df = rainbo.creek(basin, df_in.copy(), precName, deficit35, deficit90, engine, levelMethod)
+        return df.estLevel.values, df.swc.values, df.WHC90.values
+    return run
+
+
+def _runEnsemble(basin, df_in, precName, deficit35, deficit90):
+    estLevel, swcout, whc90out = rainbo.runEnsemble(basin, df_in.index, df_in[precName].values, deficit35, deficit90)
+    return estLevel[0], swcout[0], whc90out[0]
+
+
+# the time step of the first observation is the second interval, as in creek (see getTimeSteps)
+def _runRealtime(basin, df_in, precName, deficit35, deficit90):
+    state = CreekState(basin, rainbo.getTimeSteps(df_in.index)[0], deficit35, deficit90)
+    return state.run(df_in[precName].values, df_in.index)
+
+
+def _runRealtimeStep(basin, df_in, precName, deficit35, deficit90):
+    state = CreekState(basin, rainbo.getTimeSteps(df_in.index)[0], deficit35, deficit90)
+    outputs = [(state.step(rainfall, timestamp), state.swc, state.deficit90)
+               for rainfall, timestamp in zip(df_in[precName].values, df_in.index)]
+    return np.array(outputs).T
+
+
+# {name: function(basin, df_in, precName, deficit35, deficit90) -> estLevel, swc, WHC90}
+ENGINES = {'reference': _runCreek(rainbo.REFERENCE, rainbo.LEVEL_EXACT),
+           'kernel': _runCreek(rainbo.KERNEL, rainbo.LEVEL_EXACT),
+           'kernel_table': _runCreek(rainbo.KERNEL, rainbo.LEVEL_TABLE),
+           'ensemble': _runEnsemble,
+           'realtime': _runRealtime,
+           'realtime_step': _runRealtimeStep}
+
+
+def _runEvent(basinName, fileName, engine, series=SERIES_REGULAR):
+    settings = basins.getBasin(basinName)
+    df_in, deficit35, deficit90 = readEvent(settings, fileName)
+    if series == SERIES_GAPS:
+        df_in = dropRecords(df_in)
+    return ENGINES[engine](settings['parameters'], df_in, settings['precName'], deficit35, deficit90)
+
+
+# save the reference outputs of all the events of a basin: one array for each event and field,
+# with the parameter values used
+def snapshot(basinName, nrWorkers=1):
+    settings = basins.getBasin(basinName)
+    fileNames = basins.getEventFiles(settings)
+    arguments = ([basinName] * len(fileNames), fileNames, ['reference'] * len(fileNames))
+    if nrWorkers > 1:
+        with ProcessPoolExecutor(max_workers=nrWorkers) as executor:
+            results = list(executor.map(_runEvent, *arguments))
+    else:
+        results = list(map(_runEvent, *arguments))
+
+    golden = {'parameters': np.array(list(settings['parameters']), dtype=float)}
+    for fileName, outputs in zip(fileNames, results):
+        for field, values in zip(FIELDS, outputs):
+            golden[os.path.basename(fileName) + ':' + field] = np.asarray(values, dtype=float)
+
+    goldenFileName = getGoldenFileName(settings)
+    os.makedirs(os.path.dirname(goldenFileName), exist_ok=True)
+    np.savez_compressed(goldenFileName, **golden)
+    return goldenFileName
+
+
+# maximum absolute difference of each field of one engine from the reference on one event
+# series: SERIES_REGULAR (reference outputs of the snapshot) or SERIES_GAPS (reference creek on the same records)
+def _compareEvent(basinName, fileName, engine, series=SERIES_REGULAR):
+    settings = basins.getBasin(basinName)
+    eventName = os.path.basename(fileName)
+    if series == SERIES_GAPS:
+        reference = _runEvent(basinName, fileName, 'reference', series)
+    else:
+        with np.load(getGoldenFileName(settings)) as golden:
+            reference = [golden[eventName + ':' + field] for field in FIELDS]
+
+    outputs = _runEvent(basinName, fileName, engine, series)
+    errors = []
+    for expected, values in zip(reference, outputs):
+        values = np.asarray(values, dtype=float)
+        if values.shape != expected.shape or (np.isnan(values) != np.isnan(expected)).any():
+            errors.append(np.inf)
+        else:
+            difference = np.abs(values - expected)
+            errors.append(float(np.nanmax(difference)) if len(difference) > 0 else 0.0)
+    return errors
+
+
+# compare engines with the reference outputs of the basins, in parallel on nrWorkers processes
+# returns a DataFrame with the maximum error and the tolerance of each basin, event, series, engine and field
+def check(basinNames, engines, nrWorkers=1):
+    tasks = []
+    for basinName in basinNames:
+        settings = basins.getBasin(basinName)
+        goldenFileName = getGoldenFileName(settings)
+        if not os.path.exists(goldenFileName):
+            raise FileNotFoundError("missing reference outputs, run the snapshot: " + goldenFileName)
+        with np.load(goldenFileName) as golden:
+            if not np.array_equal(golden['parameters'], np.array(list(settings['parameters']), dtype=float)):
+                raise ValueError("reference outputs of different parameters: " + goldenFileName)
+            eventNames = sorted({key.split(':')[0] for key in golden.files if ':' in key})
+        for eventName in eventNames:
+            for engine in engines:
+                for series in [SERIES_REGULAR, SERIES_GAPS]:
+                    tasks.append((basinName, os.path.join(settings['inputPath'], eventName), engine, series))
+
+    arguments = list(zip(*tasks))
+    if nrWorkers > 1:
+        with ProcessPoolExecutor(max_workers=nrWorkers) as executor:
+            results = list(executor.map(_compareEvent, *arguments))
+    else:
+        results = list(map(_compareEvent, *arguments))
+
+    rows = []
+    for (basinName, fileName, engine, series), errors in zip(tasks, results):
+        for field, error in zip(FIELDS, errors):
+            tolerance = TOLERANCES.get(engine, {}).get(field, 0.0)
+            rows.append([basinName, os.path.basename(fileName), series, engine, field, error, tolerance,
+                         error <= tolerance])
+    return pd.DataFrame(rows, columns=['basin', 'event', 'series', 'engine', 'field', 'maxError', 'tolerance',
+                                       'passed'])
+
+
+def main():
+    engines = [engine for engine in ENGINES if engine != 'reference']
+    parser = argparse.ArgumentParser(description="Criteria-Rainbo golden-output regression")
+    parser.add_argument('command', choices=['snapshot', 'check'])
+    parser.add_argument('--basins', nargs='+', default=['RAVONE', 'QUADERNA'], help="basin names in basins.json")
+    parser.add_argument('--engines', nargs='+', default=engines, choices=engines, help="engines to check")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of parallel processes")
+    args = parser.parse_args()
+    nrWorkers = max(args.workers, 1)
+
+    if args.command == 'snapshot':
+        for basinName in args.basins:
+            print("Reference outputs: ", snapshot(basinName, nrWorkers))
+        return
+
+    df_check = check(args.basins, args.engines, nrWorkers)
+    print(df_check.groupby(['basin', 'series', 'engine', 'field'])[['maxError', 'tolerance']].max())
+    failed = df_check[~df_check.passed]
+    if len(failed) > 0:
+        print("Failed: ")
+        print(failed.to_string(index=False))
+        sys.exit(1)
+    print("All engines within tolerance")
+
+
+if __name__ == '__main__':
+    main()
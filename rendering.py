@@ -0,0 +1,130 @@
+# headless rendering of the validation and scenario figures
+# figures are drawn on the Agg canvas without pyplot: one figure for each size is reused by each process
+# and cleared after saving, so batch runs do not keep figures open
+# dates are plotted as matplotlib date numbers (not as strings), with date formatters on the x axis
+# a figure can be drawn at once (render) or described as a job (name, arguments) and rendered later,
+# also in a process pool (renderJobs)
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# {figsize: figure} of the current process
+_figures = {}
+
+
+# empty figure of the given size with an Agg canvas
+def getFigure(figsize):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = _figures.get(figsize)
+    if figure is None:
+        figure = Figure(figsize=figsize)
+        FigureCanvasAgg(figure)
+        _figures[figsize] = figure
+    figure.clear()
+    return figure
+
+
+def saveFigure(figure, outputFileName, dpi=100):
+    figure.savefig(outputFileName, bbox_inches='tight', dpi=dpi)
+    figure.clear()
+
+
+# matplotlib date numbers of dates (tz-aware dates are plotted in UTC)
+def getDateNumbers(dates):
+    import matplotlib.dates as md
+
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        dates = dates.tz_convert(None)
+    return md.date2num(dates.values)
+
+
+# observed and estimated levels of one validation event, with the peaks (dates, levels)
+def plotEvent(outputFileName, dates, observed, estimated, peaksObs, peaksEst, title, levelLimits):
+    import matplotlib.dates as md
+
+    figure = getFigure((10, 5))
+    figure.subplots_adjust(bottom=0.2)
+    ax = figure.add_subplot()
+    ax.xaxis.set_major_formatter(md.DateFormatter('%Y-%m-%d %H:%M'))
+    ax.tick_params(axis='x', labelrotation=75)
+    ax.set_ylim(levelLimits)
+    ax.grid(linestyle=':')
+
+    x = getDateNumbers(dates)
+    ax.plot(x, observed, 'r.', label='Observed')
+    ax.plot(x, estimated, label='Estimated')
+    ax.set_ylabel('water level [m]')
+    ax.set_title(title, size=12)
+    for peakDates, peakLevels in [peaksObs, peaksEst]:
+        ax.plot(getDateNumbers(peakDates), peakLevels, "x")
+    ax.legend()
+    saveFigure(figure, outputFileName)
+
+
+# observed and estimated levels of one event with the levels of the scenarios,
+# the precipitation [mm] on the secondary axis and the alarm levels [m] (warning, prealarm, alarm)
+def plotScenarios(outputFileName, dates, precipitation, observed, estimated, scenarioLevels, scenarioLabels,
+                  alarmLevels, title, colors=('red', 'orange', 'lightgreen', 'green', 'pink')):
+    import matplotlib.dates as md
+    from matplotlib.ticker import MultipleLocator
+
+    x = getDateNumbers(dates)
+    timeStep = x[1] - x[0]          # [days]
+
+    figure = getFigure((15, 7))
+    figure.subplots_adjust(bottom=0.2)
+    ax = figure.add_subplot()
+    ax.plot(x, observed, linewidth=1.5, label='Obs level', color='black')
+    ax.plot(x, estimated, linewidth=1.5, label='Real-time fcst', color='blue')
+    ax.set_ylabel('Water level [m]')
+
+    # secondary axes: prec
+    axp = ax.twinx()
+    precMax = max(int(np.nanmax(precipitation)) + 1, 5)
+    axp.set_ylim([0.0, precMax])
+    axp.bar(x, precipitation, width=0.8 * timeStep, alpha=0.5, color='steelblue')
+    axp.set_ylabel('Rainfall [mm]')
+
+    for i, levels in enumerate(scenarioLevels):
+        ax.plot(x, levels, label=scenarioLabels[i], color=colors[i % len(colors)], linewidth=2, linestyle='dotted')
+
+    for level, color, label in zip(alarmLevels, ['yellow', 'orange', 'red'], ['warning', 'prealarm', 'alarm']):
+        ax.axhline(level, linestyle='dashed', color=color, label=label)
+
+    # x axis: major ticks every 6 time steps
+    ax.set_xlim(x[0] - timeStep, x[-1] + timeStep)
+    ax.xaxis.set_major_locator(MultipleLocator(6 * timeStep))
+    ax.xaxis.set_minor_locator(MultipleLocator(timeStep))
+    ax.xaxis.set_major_formatter(md.DateFormatter('%d/%m %H:%M'))
+    ax.tick_params(axis='x', labelrotation=80)
+
+    ax.set_title(title)
+    ax.legend(loc='upper left')
+    saveFigure(figure, outputFileName)
+
+
+PLOT_FUNCTIONS = {'event': plotEvent, 'scenarios': plotScenarios}
+
+
+# deferred figure: name in PLOT_FUNCTIONS and dictionary of arguments
+def makeJob(name, **arguments):
+    return name, arguments
+
+
+def render(job):
+    name, arguments = job
+    PLOT_FUNCTIONS[name](**arguments)
+    return arguments.get('outputFileName')
+
+
+# render a list of jobs, in parallel on nrWorkers processes: returns the output file names
+def renderJobs(jobs, nrWorkers=1):
+    jobs = [job for job in jobs if job is not None]
+    if nrWorkers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=nrWorkers) as executor:
+            return list(executor.map(render, jobs))
+    return list(map(render, jobs))
@@ -0,0 +1,139 @@
+# normalisation of the input series of Criteria-Rainbo model: rainfall resampled on a uniform time grid
+# each rainfall record [mm] is the accumulation of its interval (Datai - Dataf, or sourceStep before Dataf),
+# its rain is distributed to the time steps of the grid in proportion to the overlap (the total is preserved)
+# the intervals not covered by any record (gaps) are filled following an explicit policy
+
+import argparse
+import numpy as np
+import pandas as pd
+import basins
+
+GAP_ZERO = 'zero'       # no rain in the gaps
+GAP_SPREAD = 'spread'   # the rain of the record after a gap is spread over the gap
+GAP_NAN = 'nan'         # the time steps overlapping a gap are missing (nan): to be filled before the simulation
+GAP_ERROR = 'error'     # a gap raises ValueError
+
+START_NAME = 'Datai'
+TIME_NAME = 'Dataf'
+
+
+# [s] time step of the precipitation of a basin: precName is P<minutes> (e.g. P30)
+def getBasinTimeStep(settings):
+    return int(settings['precName'][1:]) * 60
+
+
+# [s] epoch time of a DatetimeIndex
+def _getSeconds(dates):
+    return np.asarray(dates.asi8) / 1e9
+
+
+# rainfall [mm] resampled on a grid of timeStep [s], aligned to multiples of timeStep
+# the grid covers all the records, the first and last time steps can be partially covered
+# series: rainfall indexed by the end of the intervals (DatetimeIndex), nan records are missing
+# sourceStep: [s] length of the interval of each record (scalar or array, nan where unknown),
+# default: median interval of the series
+# maxGap: [s] longest gap allowed with any policy (ValueError if exceeded)
+# returns a Series indexed by the end of the grid intervals
+def normalizeRainfall(series, timeStep, gapPolicy=GAP_ZERO, sourceStep=None, maxGap=None):
+    sourceStep = np.broadcast_to(np.asarray(np.nan if sourceStep is None else sourceStep, dtype=float), series.shape)
+    isValid = series.notna().values
+    dates = pd.DatetimeIndex(series.index[isValid])
+    if len(dates) == 0:
+        raise ValueError("no rainfall data")
+    order = np.argsort(dates, kind='stable')
+    dates = dates[order]
+    values = series.values[isValid][order].astype(float)
+    sourceStep = sourceStep[isValid][order]
+
+    end = _getSeconds(dates)
+    defaultStep = np.median(np.diff(end)) if len(end) > 1 else timeStep
+    start = end - np.where(np.isnan(sourceStep), defaultStep, sourceStep)
+
+    # the intervals cannot overlap the previous record
+    previousEnd = np.concatenate([start[:1], end[:-1]])
+    start = np.minimum(np.maximum(start, previousEnd), end)
+    gapLength = start - previousEnd
+    isGap = gapLength > 0
+    if isGap.any():
+        if gapPolicy == GAP_ERROR:
+            raise ValueError("gap in rainfall data before " + str(dates[isGap.argmax()]))
+        if maxGap is not None and gapLength.max() > maxGap:
+            raise ValueError("gap longer than " + str(maxGap) + " s before " + str(dates[gapLength.argmax()]))
+        if gapPolicy == GAP_SPREAD:
+            start = previousEnd
+
+    step = pd.Timedelta(seconds=timeStep)
+    boundaries = pd.date_range(dates[0] - pd.Timedelta(seconds=end[0] - start[0]), dates[-1], freq=step)
+    boundaries = pd.date_range(boundaries[0].floor(step), dates[-1].ceil(step), freq=step)
+    gridTime = _getSeconds(boundaries)
+
+    # time steps overlapped by each record (at least the one of its end), rain distributed by overlap length
+    last = np.searchsorted(gridTime, end, side='left') - 1
+    first = np.minimum(np.searchsorted(gridTime, start, side='right') - 1, last)
+    count = last - first + 1
+    record = np.repeat(np.arange(len(end)), count)
+    target = first[record] + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    length = end[record] - start[record]
+    overlap = np.minimum(end[record], gridTime[target + 1]) - np.maximum(start[record], gridTime[target])
+    weight = np.where(length > 0, overlap / np.where(length > 0, length, 1), 1.0)
+    rainfall = np.zeros(len(gridTime) - 1)
+    np.add.at(rainfall, target, weight * values[record])
+
+    if gapPolicy == GAP_NAN and isGap.any():
+        # the last gap starting before the end of each time step
+        gapStart, gapEnd = previousEnd[isGap], start[isGap]
+        index = np.searchsorted(gapStart, gridTime[1:], side='left') - 1
+        isMissing = (index >= 0) & (gapEnd[np.maximum(index, 0)] > gridTime[:-1])
+        rainfall[isMissing] = np.nan
+
+    return pd.Series(rainfall, index=boundaries[1:], name=series.name)
+
+
+# event table (Datai, Dataf, precipitation and level columns, as INPUT csv files) on a grid of timeStep [s]
+# the rainfall is resampled with normalizeRainfall (record intervals from Datai if present),
+# the other numeric columns are instantaneous values: nearest record within half time step, nan otherwise
+def normalizeEvent(df_in, precName, timeStep, gapPolicy=GAP_ZERO, maxGap=None):
+    dates = pd.DatetimeIndex(pd.to_datetime(df_in[TIME_NAME]))
+    sourceStep = None
+    if START_NAME in df_in:
+        sourceStep = (dates - pd.DatetimeIndex(pd.to_datetime(df_in[START_NAME]))).total_seconds().values
+
+    rainfall = pd.Series(df_in[precName].values, index=dates, name=precName)
+    rainfall = normalizeRainfall(rainfall, timeStep, gapPolicy, sourceStep, maxGap)
+
+    df_out = pd.DataFrame({START_NAME: rainfall.index - pd.Timedelta(seconds=timeStep), TIME_NAME: rainfall.index})
+    df_out[precName] = rainfall.values
+    isOrdered = np.argsort(dates, kind='stable')
+    for name in df_in.columns:
+        if name in (START_NAME, TIME_NAME, precName) or not pd.api.types.is_numeric_dtype(df_in[name]):
+            continue
+        values = pd.Series(df_in[name].values[isOrdered], index=dates[isOrdered])
+        values = values[~values.index.duplicated()]
+        df_out[name] = values.reindex(rainfall.index, method='nearest',
+                                      tolerance=pd.Timedelta(seconds=timeStep / 2)).values
+    return df_out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="resample an event csv on a uniform time grid")
+    parser.add_argument('basin', help="basin name in basins.json (e.g. QUADERNA)")
+    parser.add_argument('event', help="event csv file (Datai, Dataf, precipitation and level columns)")
+    parser.add_argument('output', help="output csv file")
+    parser.add_argument('--time-step', type=float, default=None, help="[s] time step of the grid, "
+                                                                      "default: the time step of the basin")
+    parser.add_argument('--gap-policy', default=GAP_ZERO, choices=[GAP_ZERO, GAP_SPREAD, GAP_NAN, GAP_ERROR])
+    parser.add_argument('--max-gap', type=float, default=None, help="[s] longest gap allowed")
+    args = parser.parse_args()
+
+    settings = basins.getBasin(args.basin)
+    precName = settings['precName']
+    timeStep = getBasinTimeStep(settings) if args.time_step is None else args.time_step
+    df_in = pd.read_csv(args.event)
+    df_out = normalizeEvent(df_in, precName, timeStep, args.gap_policy, args.max_gap)
+    df_out.to_csv(args.output, index=False)
+    print("Records: ", len(df_in), "->", len(df_out), "\tprecipitation: ", round(df_in[precName].sum(), 2),
+          "->", round(np.nansum(df_out[precName]), 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+# skill scores of estimated vs observed water levels: correlation, RMSE and peak error/timing
+# scipy is imported by the functions that use it, not at import time
+
+import numpy as np
+import pandas as pd
+
+# parameters for peaks recognitions
+PEAK_HMIN = 0.2             # [m] hmin for peak search
+PEAK_PROMINENCE = 0.1       # [m] minimum peak prominence
+PEAK_WIDTH = 2              # [timestep] minimal horizontal distance in samples between neighbouring peaks
+
+# [hours] window of the time shift (observed - estimated) of matching peaks
+PEAK_WINDOW = (-0.5, 3.0)
+
+
+# positions of the peaks of a level series
+def findPeaks(level, hmin=PEAK_HMIN, prominence=PEAK_PROMINENCE, width=PEAK_WIDTH):
+    from scipy.signal import find_peaks
+
+    peaks, _ = find_peaks(level, height=hmin, prominence=prominence, width=width)
+    return peaks
+
+
+# match each estimated peak with the first observed peak inside the time window
+# estTimes, obsTimes: datetime64 times of the peaks, obsTimes sorted
+# returns the positions of the matched estimated peaks and of their observed peaks
+def matchPeaks(estTimes, obsTimes, window=PEAK_WINDOW):
+    estTimes = np.asarray(estTimes, dtype='datetime64[ns]')
+    obsTimes = np.asarray(obsTimes, dtype='datetime64[ns]')
+    windowStart = estTimes + np.timedelta64(int(window[0] * 3600e9), 'ns')
+    windowEnd = estTimes + np.timedelta64(int(window[1] * 3600e9), 'ns')
+
+    obsIndex = np.searchsorted(obsTimes, windowStart, side='left')
+    isMatched = obsIndex < len(obsTimes)
+    isMatched[isMatched] = obsTimes[obsIndex[isMatched]] <= windowEnd[isMatched]
+    return np.flatnonzero(isMatched), obsIndex[isMatched]
+
+
+# mean peak error [m] and mean time shift [hours] (observed - estimated) of the matched peaks, nan if no match
+def computePeakScores(times, observed, estimated, peaksObs, peaksEst, window=PEAK_WINDOW):
+    times = np.asarray(times, dtype='datetime64[ns]')
+    estMatched, obsMatched = matchPeaks(times[peaksEst], times[peaksObs], window)
+    if len(estMatched) == 0:
+        return np.nan, np.nan
+    estPeaks = peaksEst[estMatched]
+    obsPeaks = peaksObs[obsMatched]
+    dt = (times[obsPeaks] - times[estPeaks]) / np.timedelta64(1, 'h')
+    dm = estimated[estPeaks] - observed[obsPeaks]
+    return np.mean(dm), np.mean(dt)
+
+
+# time steps of the shift of the estimate: the mean anticipation of the peaks [hours] if not negative,
+# shiftDefault [hours] otherwise (also without matched peaks)
+def getShiftSteps(mPeak_anti, nrIntervals, shiftDefault):
+    if mPeak_anti >= 0:
+        return round(mPeak_anti * nrIntervals)
+    return round(shiftDefault * nrIntervals)
+
+
+# RMSE [m] of the estimate shifted as in computeScores, not rounded (objective of the calibration)
+# times, observed, estimated: valid observations only; without runoff (constant estimate) the estimate is not shifted
+def computeShiftedRmse(times, observed, estimated, nrIntervals, shiftDefault):
+    from scipy.ndimage import shift
+
+    if (estimated == estimated[0]).all():
+        return np.sqrt(((estimated - observed) ** 2).mean())
+    peaksObs = findPeaks(observed)
+    peaksEst = findPeaks(estimated)
+    _, mPeak_anti = computePeakScores(times, observed, estimated, peaksObs, peaksEst)
+    shiftNr = getShiftSteps(round(mPeak_anti, 2), nrIntervals, shiftDefault)
+    return np.sqrt(((shift(estimated, shiftNr) - observed) ** 2).mean())
+
+
+# scores of an event, without plotting
+# times: datetime64 times, observed/estimated: [m] levels (nan where observed is missing)
+# nrIntervals: time steps in one hour, shiftDefault: [hours] shift of the estimate when the peaks are not anticipated
+# returns a dictionary with R, R_SHIFT, RMSE, mP_error, mP_ant (nan R and RMSE for events without runoff, isRunoff)
+# and the positions of the peaks (peaksObs, peaksEst) in the series of valid observations (isObserved)
+def computeScores(times, observed, estimated, nrIntervals, shiftDefault):
+    from scipy.ndimage import shift
+    from scipy.stats import pearsonr
+
+    times = np.asarray(times, dtype='datetime64[ns]')
+    observed = np.asarray(observed, dtype=float)
+    estimated = np.asarray(estimated, dtype=float)
+
+    # remove values with empty data in obs
+    isObserved = ~np.isnan(observed)
+    times = times[isObserved]
+    vobs = observed[isObserved]
+    vest = estimated[isObserved]
+
+    peaksObs = findPeaks(vobs)
+    peaksEst = findPeaks(vest)
+    mPeak_err, mPeak_anti = computePeakScores(times, vobs, vest, peaksObs, peaksEst)
+    mPeak_anti = round(mPeak_anti, 2)
+    mPeak_err = round(mPeak_err, 2)
+
+    scores = {'R': np.nan, 'R_SHIFT': np.nan, 'RMSE': np.nan, 'mP_error': mPeak_err, 'mP_ant': mPeak_anti,
+              'isRunoff': False, 'isObserved': isObserved, 'peaksObs': peaksObs, 'peaksEst': peaksEst}
+    if (vest == vest[0]).all():
+        # all equal values: no runoff event
+        return scores
+
+    # shift estimated data
+    shiftNr = getShiftSteps(mPeak_anti, nrIntervals, shiftDefault)
+    vest_shift = shift(vest, shiftNr)
+
+    r, _ = pearsonr(vobs, vest)
+    r_shift, _ = pearsonr(vobs, vest_shift)
+    scores['isRunoff'] = True
+    scores['R'] = round(r, 3)
+    scores['R_SHIFT'] = round(r_shift, 3)
+    scores['RMSE'] = round(np.sqrt(((vest_shift - vobs) ** 2).mean()), 3)
+    return scores
+
+
+# moments of the pairs (observed, estimated): [n, mean obs, mean est, M2 obs, M2 est, co-moment]
+def _getMoments(observed, estimated):
+    if len(observed) == 0:
+        return np.zeros(6)
+    meanObs = observed.mean()
+    meanEst = estimated.mean()
+    deltaObs = observed - meanObs
+    deltaEst = estimated - meanEst
+    return np.array([len(observed), meanObs, meanEst,
+                     (deltaObs ** 2).sum(), (deltaEst ** 2).sum(), (deltaObs * deltaEst).sum()])
+
+
+# merge of two sets of moments (pairwise form of the Welford update)
+def _mergeMoments(a, b):
+    n = a[0] + b[0]
+    if n == 0:
+        return np.zeros(6)
+    deltaObs = b[1] - a[1]
+    deltaEst = b[2] - a[2]
+    factor = a[0] * b[0] / n
+    return np.array([n, a[1] + deltaObs * b[0] / n, a[2] + deltaEst * b[0] / n,
+                     a[3] + b[3] + deltaObs ** 2 * factor,
+                     a[4] + b[4] + deltaEst ** 2 * factor,
+                     a[5] + b[5] + deltaObs * deltaEst * factor])
+
+
+# Pearson r and RMSE [m] from the moments, nan without data (r also without variance)
+def _getSkill(moments):
+    n, meanObs, meanEst, m2Obs, m2Est, coMoment = moments
+    if n == 0:
+        return np.nan, np.nan
+    rmse = np.sqrt(max((m2Obs + m2Est - 2 * coMoment) / n, 0) + (meanEst - meanObs) ** 2)
+    if m2Obs <= 0 or m2Est <= 0:
+        return np.nan, rmse
+    return coMoment / np.sqrt(m2Obs * m2Est), rmse
+
+
+# [ns] int64 UTC times of datetime64 values or timestamps
+def _getTimes(times):
+    times = pd.DatetimeIndex(np.atleast_1d(times))
+    if times.tz is not None:
+        times = times.tz_convert(None)
+    return times.values.astype('datetime64[ns]').astype(np.int64)
+
+
+# maximum observed and estimated level [m] and their times [ns]: [max obs, time obs, max est, time est]
+def _getMaxima(times, observed, estimated):
+    iObs = np.argmax(observed)
+    iEst = np.argmax(estimated)
+    return np.array([observed[iObs], times[iObs], estimated[iEst], times[iEst]], dtype=object)
+
+
+def _mergeMaxima(a, b):
+    if a is None:
+        return b
+    c = a.copy()
+    if b[0] > a[0]:
+        c[0:2] = b[0:2]
+    if b[2] > a[2]:
+        c[2:4] = b[2:4]
+    return c
+
+
+# online skill scores of a live feed of observed/estimated levels, without storing the series
+# the pairs are accumulated in bins of binLength (e.g. '1D'): the rolling window is made of the last nrBins bins
+# shiftSteps: steps of the shift of the estimate for R_SHIFT and RMSE, as in computeScores: the shift is over
+# the valid pairs (missing observations are skipped) and the estimate before the start of the feed is 0
+class SkillAccumulator:
+    def __init__(self, binLength='1D', nrBins=30, shiftSteps=0):
+        self.binLength = pd.Timedelta(binLength).value
+        self.nrBins = int(nrBins)
+        self.shiftSteps = int(shiftSteps)
+        # {bin number: [moments, moments of the shifted estimate, maxima]} of the rolling window
+        self.bins = {}
+        # moments since the start of the feed
+        self.total = np.zeros(6)
+        self.totalShift = np.zeros(6)
+        self.totalMaxima = None
+        # estimates of the last shiftSteps valid pairs, 0 before the start of the feed
+        self._lastEstimates = np.zeros(self.shiftSteps)
+
+    # add new pairs: times (datetime64 or timestamps), observed and estimated levels [m]
+    # pairs with missing observed (nan) are skipped
+    def update(self, times, observed, estimated):
+        times = _getTimes(times)
+        observed = np.atleast_1d(np.asarray(observed, dtype=float))
+        estimated = np.atleast_1d(np.asarray(estimated, dtype=float))
+
+        # shifted estimate: the estimate of the valid pair shiftSteps pairs before
+        isValid = ~np.isnan(observed) & ~np.isnan(estimated)
+        allEstimates = np.concatenate([self._lastEstimates, estimated[isValid]])
+        shifted = np.full(len(estimated), np.nan)
+        shifted[isValid] = allEstimates[:isValid.sum()]
+        self._lastEstimates = allEstimates[len(allEstimates) - self.shiftSteps:]
+
+        binNumbers = times // self.binLength
+        for binNumber in np.unique(binNumbers[isValid]):
+            isBin = (binNumbers == binNumber) & isValid
+            moments = _getMoments(observed[isBin], estimated[isBin])
+            momentsShift = _getMoments(observed[isBin], shifted[isBin])
+            maxima = _getMaxima(times[isBin], observed[isBin], estimated[isBin])
+
+            self.total = _mergeMoments(self.total, moments)
+            self.totalShift = _mergeMoments(self.totalShift, momentsShift)
+            self.totalMaxima = _mergeMaxima(self.totalMaxima, maxima)
+            if binNumber in self.bins:
+                previous = self.bins[binNumber]
+                self.bins[binNumber] = [_mergeMoments(previous[0], moments),
+                                        _mergeMoments(previous[1], momentsShift),
+                                        _mergeMaxima(previous[2], maxima)]
+            else:
+                self.bins[binNumber] = [moments, momentsShift, maxima]
+
+        # drop the bins out of the rolling window
+        if len(self.bins) > 0:
+            lastBin = max(self.bins)
+            for binNumber in [b for b in self.bins if b <= lastBin - self.nrBins]:
+                del self.bins[binNumber]
+
+    # skill scores of the rolling window (default) or of the whole feed:
+    # dictionary with nrData, R, R_SHIFT, RMSE (of the shifted estimate), P_error [m] (maximum estimated -
+    # maximum observed level) and P_ant [hours] (time of the observed maximum - time of the estimated maximum)
+    def getScores(self, window=True):
+        if window:
+            moments = np.zeros(6)
+            momentsShift = np.zeros(6)
+            maxima = None
+            for binMoments, binMomentsShift, binMaxima in self.bins.values():
+                moments = _mergeMoments(moments, binMoments)
+                momentsShift = _mergeMoments(momentsShift, binMomentsShift)
+                maxima = _mergeMaxima(maxima, binMaxima)
+        else:
+            moments, momentsShift, maxima = self.total, self.totalShift, self.totalMaxima
+
+        r, _ = _getSkill(moments)
+        r_shift, rmse = _getSkill(momentsShift)
+        peakError = peakAnticipation = np.nan
+        if maxima is not None:
+            peakError = maxima[2] - maxima[0]
+            peakAnticipation = (maxima[1] - maxima[3]) / 3600e9
+        return {'nrData': int(moments[0]), 'R': r, 'R_SHIFT': r_shift, 'RMSE': rmse,
+                'P_error': peakError, 'P_ant': peakAnticipation}
@@ -0,0 +1,131 @@
+# scenario sweep of Criteria-Rainbo model: grids of initial deficits, rainfall scaling factors and time shifts
+# all the scenarios of the grid are members of one ensemble (runEnsemble), evaluated in chunks of members,
+# optionally in parallel; the result is a labelled N-D array of peak level and alarm crossing times
+
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import numpy as np
+import pandas as pd
+import Criteria_Rainbo_model as rainbo
+import alarms
+import basins
+import events as eventStore
+
+DIMENSIONS = ('deficit35', 'deficit90', 'scale', 'shift')
+
+# members evaluated together
+CHUNK_SIZE = 2000
+
+# dims: names of the grid dimensions, coords: {dimension: values} (shift in hours, alarm levels in m)
+# peakLevel [m], peakTime: grid arrays; crossingTime: grid x alarm array of first crossing times (NaT if none)
+SweepResult = namedtuple('SweepResult', ['dims', 'coords', 'peakLevel', 'peakTime', 'crossingTime'])
+
+
+# rainfall [mm] delayed by shift time steps (anticipated if negative), zero outside the series
+def shiftRainfall(precipitation, shift):
+    precipitation = np.asarray(precipitation, dtype=float)
+    shifted = np.zeros_like(precipitation)
+    if shift >= 0:
+        shifted[shift:] = precipitation[:len(precipitation) - shift]
+    else:
+        shifted[:shift] = precipitation[-shift:]
+    return shifted
+
+
+def _runChunk(basin, dates, precipitation, deficit35, deficit90, alarmLevels):
+    with np.errstate(over='ignore'):
+        estLevel, _, _ = rainbo.runEnsemble(basin, dates, precipitation, deficit35, deficit90)
+    return estLevel.max(axis=1), estLevel.argmax(axis=1), alarms.getFirstCrossings(estLevel, alarmLevels)
+
+
+# run the grid of scenarios of one event
+# basin: basin id or BasinParameters record, dates: DatetimeIndex, precipitation: [mm] rainfall of the event
+# deficit35, deficit90: [mm] values of the initial deficits, scales: rainfall factors, shifts: [hours] rainfall delays
+# alarmLevels: [m] thresholds of the crossing times
+def runSweep(basin, dates, precipitation, deficit35, deficit90, scales=(1.0,), shifts=(0.0,), alarmLevels=(),
+             chunkSize=CHUNK_SIZE, nrWorkers=1):
+    dates = pd.DatetimeIndex(dates)
+    precipitation = np.asarray(precipitation, dtype=float)
+    timeStep = (dates[1] - dates[0]).total_seconds()
+    coords = {'deficit35': np.atleast_1d(np.asarray(deficit35, dtype=float)),
+              'deficit90': np.atleast_1d(np.asarray(deficit90, dtype=float)),
+              'scale': np.atleast_1d(np.asarray(scales, dtype=float)),
+              'shift': np.atleast_1d(np.asarray(shifts, dtype=float)),
+              'alarm': np.atleast_1d(np.asarray(alarmLevels, dtype=float))}
+    shape = tuple(len(coords[dimension]) for dimension in DIMENSIONS)
+
+    # one rainfall series for each (scale, shift), members in the order of the grid
+    rainfall = np.array([scale * shiftRainfall(precipitation, int(round(shift * 3600 / timeStep)))
+                         for scale, shift in itertools.product(coords['scale'], coords['shift'])])
+    grid = np.indices(shape).reshape(len(shape), -1)
+    rainfallIndex = grid[2] * shape[3] + grid[3]
+    memberDeficit35 = coords['deficit35'][grid[0]]
+    memberDeficit90 = coords['deficit90'][grid[1]]
+
+    nrMembers = grid.shape[1]
+    chunks = [slice(first, min(first + chunkSize, nrMembers)) for first in range(0, nrMembers, chunkSize)]
+    arguments = ([basin] * len(chunks), [dates] * len(chunks),
+                 [rainfall[rainfallIndex[chunk]] for chunk in chunks],
+                 [memberDeficit35[chunk] for chunk in chunks], [memberDeficit90[chunk] for chunk in chunks],
+                 [coords['alarm']] * len(chunks))
+    if nrWorkers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=nrWorkers) as executor:
+            results = list(executor.map(_runChunk, *arguments))
+    else:
+        results = list(map(_runChunk, *arguments))
+
+    peakLevel = np.concatenate([peak for peak, _, _ in results])
+    peakIndex = np.concatenate([index for _, index, _ in results])
+    crossingIndex = np.concatenate([crossings for _, _, crossings in results])
+
+    # the last time is NaT (crossing index -1)
+    times = dates.append(pd.DatetimeIndex([pd.NaT], tz=dates.tz)).values
+    peakTime = times[peakIndex].reshape(shape)
+    crossingTime = times[crossingIndex].reshape(shape + (len(coords['alarm']),))
+    return SweepResult(DIMENSIONS, coords, peakLevel.reshape(shape), peakTime, crossingTime)
+
+
+# sweep result as a long table: one row for each scenario (and alarm level for the crossing times)
+def toFrame(result):
+    index = pd.MultiIndex.from_product([result.coords[dimension] for dimension in result.dims], names=result.dims)
+    df_out = pd.DataFrame({'peakLevel': result.peakLevel.ravel(), 'peakTime': result.peakTime.ravel()}, index=index)
+    for i, alarmLevel in enumerate(result.coords['alarm']):
+        df_out['crossing_' + str(alarmLevel)] = result.crossingTime[..., i].ravel()
+    return df_out
+
+
+# sweep result as an xarray Dataset (xarray is required)
+def toDataset(result):
+    import xarray as xr
+
+    return xr.Dataset({'peakLevel': (result.dims, result.peakLevel),
+                       'peakTime': (result.dims, result.peakTime),
+                       'crossingTime': (result.dims + ('alarm',), result.crossingTime)},
+                      coords=result.coords)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Criteria-Rainbo scenario sweep of one event")
+    parser.add_argument('basin', help="basin name in basins.json (e.g. QUADERNA)")
+    parser.add_argument('event', help="event csv file (Dataf and precipitation columns)")
+    parser.add_argument('output', help="output csv file")
+    parser.add_argument('--deficit35', nargs='+', type=float, default=list(range(0, 90, 10)), help="[mm]")
+    parser.add_argument('--deficit90', nargs='+', type=float, default=list(range(0, 225, 25)), help="[mm]")
+    parser.add_argument('--scales', nargs='+', type=float, default=[1.0], help="rainfall scaling factors")
+    parser.add_argument('--shifts', nargs='+', type=float, default=[0.0], help="[hours] rainfall time shifts")
+    parser.add_argument('--workers', type=int, default=1, help="number of parallel processes")
+    args = parser.parse_args()
+
+    settings = basins.getBasin(args.basin)
+    df_in = eventStore.readEventCsv(args.event)
+    result = runSweep(settings['parameters'], df_in.index, df_in[settings['precName']].values,
+                      args.deficit35, args.deficit90, args.scales, args.shifts, settings['alarmLevels'],
+                      nrWorkers=max(args.workers, 1))
+    toFrame(result).to_csv(args.output)
+    print("Scenarios: ", result.peakLevel.size, "\tOutput file: ", args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,61 +2,37 @@
 # May 2022, Revisited March 2024, -> Criteria-Rainbo
 # update July 2025
 
-import matplotlib.pyplot as plt
-import matplotlib.dates as md
 import pandas as pd
-import numpy as np
-from scipy.ndimage import shift
-from scipy.stats import pearsonr
-from scipy.signal import find_peaks
-import glob
-from datetime import datetime, timedelta
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 import sys
 sys.path.append("../")                      # cerca i moduli anche nella dir sopra
 from Criteria_Rainbo_model import *
-
-
-def nearest_date(items, pivot):
-    if len(items) > 0:
-        for t in range(len(items)):
-            delta = (items[t] - pivot) / np.timedelta64(1, 'h')     # hours
-            if (delta >= -0.5) and (delta <= 3.0):
-                return items[t]
-    return -1
-
-
-# parameters for peaks recognitions
-peak_hmin = 0.2  # [m] hmin for peak search
-peak_prominence = 0.1  # [m] minimum peak prominence
-peak_width = 2  # [timestep] minimal horizontal distance in samples between neighbouring peaks
-
-basin = QUADERNA
-
-if basin == QUADERNA:
-    inputPath = "./INPUT/QUADERNA/"
-    outputPath = "./OUTPUT/QUADERNA/"
-    criteriaOutputFileName = inputPath + "CriteriaOutput/Quaderna.csv"
-    shift_default = 1.5         # hours
-    all_files = glob.glob(inputPath + "Quaderna_*.csv")
-    precName = 'P30'
-elif basin == RAVONE:
-    inputPath = "./INPUT/RAVONE/"
-    outputPath = "./OUTPUT/RAVONE/"
-    criteriaOutputFileName = inputPath + "CriteriaOutput/Ravone.csv"
-    shift_default = 0.5         # hours
-    all_files = glob.glob(inputPath + "Test_*.csv")
-    precName = 'P15'
-    
-# insert complete filename to read a single test case or wildcard for all cases
-df_daily = pd.read_csv(criteriaOutputFileName)
-df_daily.index = pd.to_datetime(df_daily['DATE'])
-
-# loop on several cases
-list_scores = []
-for fileName in all_files:
-    df_in = pd.read_csv(fileName)
-    df_in.index = pd.to_datetime(df_in['Dataf'])
-    del df_in['Dataf']
+import basins
+import deficits
+import rendering
+import scores
+import events as eventStore
+
+
+# basin of the validation when not selected
+DEFAULT_BASIN = 'QUADERNA'
+
+
+# validation of one event: returns the row of scores (None for events without runoff)
+# and the figure of the event as a rendering job
+# settings: basin settings (basins.getBasin), the outputs are written in its outputPath
+# useStore: read the event from the binary event store instead of the csv
+# tableFormat, figureFormat: formats of the output tables (events.TABLE_FORMATS) and figure (e.g. png, pdf, svg)
+def evaluateEvent(settings, fileName, useStore=False, tableFormat='csv', figureFormat='png'):
+    outputPath = settings['outputPath']
+    precName = settings['precName']
+    if useStore:
+        store = eventStore.loadEventStore(settings['name'])
+        df_in = eventStore.getEventFrame(store, eventStore.getEventIndex(store, fileName))
+    else:
+        df_in = eventStore.readEventCsv(fileName)
 
     # compute time step
     date0 = df_in.index[0]
@@ -64,110 +40,128 @@ for fileName in all_files:
     timeStep = (date1 - date0).seconds # [s]
     nrIntervals = int(3600 / timeStep)
 
-    #print(fileName, date0)
     # [mm] water holding capacity from daily preprocessed data
-    deficit35 = max(df_daily[df_daily.index == (date0 - timedelta(days=1)).strftime("%Y-%m-%d")].DEFICIT_35.values[0],0) #WHC = df.WHC[0]
-    deficit90 = df_daily[df_daily.index == (date0 - timedelta(days=1)).strftime("%Y-%m-%d")].DEFICIT_90.values[0] 
- 
+    dailyDeficits = deficits.loadDailyDeficits(settings['criteriaOutputFileName'])
+    deficit35, deficit90 = deficits.getInitialDeficits(dailyDeficits, date0)
+
     # Run Criteria-Rainbo model with df_in in input and wch35/whc90
-    df = creek(basin, df_in, precName, deficit35, deficit90)
-    
-    positive_swc = df.index[df.swc > 0].strftime("%d-%m %H:%M").tolist()   
+    df = creek(settings['parameters'], df_in, precName, deficit35, deficit90, engine=KERNEL)
+
+    positive_swc = df.index[df.swc > 0].strftime("%d-%m %H:%M").tolist()
     r_start = positive_swc[0] if len(positive_swc) > 0 else 'No RunOff'
     raincum = df[precName].sum()
 
-    # remove roows with empty data in obs
-    df_clean = df[df['Livello'].notna()]
+    # scores: correlation, RMSE, peaks error and anticipation
+    eventScores = scores.computeScores(df.index.values, df.Livello.values, df.estLevel.values,
+                                       nrIntervals, settings['shiftDefault'])
+    r = eventScores['R']
+    RMSE = eventScores['RMSE']
+    mPeak_err = eventScores['mP_error']
+    mPeak_anti = eventScores['mP_ant']
 
-    # estimation array
+    # remove roows with empty data in obs
+    df_clean = df[eventScores['isObserved']]
     vest = df_clean.estLevel.values
-    # observed array
     vobs = df_clean.Livello.values
-    # index
     xo = df_clean.index
 
-    # searching for multiple peaks and relative statistics
-    peaks_obs, prop_peak_obs = find_peaks(vobs, height=peak_hmin, prominence=peak_prominence,width=peak_width)
-    peaks_est, prop_peak_est = find_peaks(vest, height=peak_hmin, prominence=peak_prominence,width=peak_width)
-
-    level_peaks_obs = df_clean.Livello[df_clean.index[peaks_obs]]
-    level_peaks_est = df_clean.estLevel[df_clean.index[peaks_est]]
-
     # maximum values
-    frame = {'maxOBS': level_peaks_obs, 'maxEST': level_peaks_est}
+    frame = {'maxOBS': df_clean.Livello.iloc[eventScores['peaksObs']],
+             'maxEST': df_clean.estLevel.iloc[eventScores['peaksEst']]}
     df_max = pd.DataFrame(frame)
     df_max = df_max.dropna(axis=0, how='all')
-    array_peak_obs = df_max.maxOBS.dropna()
-    array_peak_est = df_max.maxEST.dropna()
-
-    dt = []
-    dm = []
-    # loop sulle date dei massimi osservati per associarli con i previsti
-    for timeIndex in array_peak_est.index:
-        nearest = nearest_date(array_peak_obs.index, timeIndex)  # trova l'ora del picco più vicino a quello osservato
-        if nearest != -1:
-            dt.append((nearest - timeIndex) / np.timedelta64(1, 'h'))       # calcola il time shift
-            dm.append(df_max.maxEST[timeIndex] - df_max.maxOBS[nearest])    # calcola l'errore
-
-    # mean peaks characteristics
-    mPeak_anti = round(np.mean(dt), 2)
-    mPeak_err = round(np.mean(dm), 2)
-
-    if (vest == vest[0]).all():
-        # tutti dati uguali: no runoff event
-        r = np.nan
-        r_shift = np.nan
-    else:
-        # shift estimated data
-        if mPeak_anti >= 0:
-            shiftNr = round(mPeak_anti * nrIntervals)
-        else:
-            shiftNr = round(shift_default * nrIntervals)
-        vest_shift = shift(vest, shiftNr)
 
-        r, p_value = pearsonr(vobs, vest)
-        r_shift, p_value = pearsonr(vobs, vest_shift)
-        r = round(r, 3)
-        r_shift = round(r_shift, 3)
-
-        RMSE = np.sqrt(((vest_shift - vobs) ** 2).mean())
-        RMSE = round(RMSE, 3)
-
-        string_ini = date0.strftime("%d-%m-%Y")
-        val_evento = [string_ini, deficit35, r, r_shift, RMSE, mPeak_err, mPeak_anti]
-        list_scores.append(val_evento)
+    string_ini = date0.strftime("%d-%m-%Y")
+    val_evento = None
+    if eventScores['isRunoff']:
+        val_evento = [string_ini, deficit35, r, eventScores['R_SHIFT'], RMSE, mPeak_err, mPeak_anti]
 
     # print
     print("Evento: ", string_ini, "WHC35: ", deficit35, "\tWHC90: ", deficit90,
           "\tRaincum: ", round(raincum, 1), "\tRunoff start: ", r_start)
- 
-    # plot
-    plt.figure(figsize=(10, 5))
-    plt.subplots_adjust(bottom=0.2)
-    plt.xticks(rotation=75)
-    ax = plt.gca()
-    xfmt = md.DateFormatter('%Y-%m-%d %H:%M')
-    ax.xaxis.set_major_formatter(xfmt)
-    if basin == QUADERNA:
-        ax.set_ylim([0, 2.5])
-    else:
-        # Ravone
-        ax.set_ylim([-0.2, 4.0])
-    ax.grid(linestyle=':')
-    ax.plot(xo, vobs, 'r.', label='Observed')
-    ax.plot(xo, vest, label='Estimated')
-    ax.set_ylabel('water level [m]')
-    plt.title('WHCini 35/90=' + str(round(deficit35, 0)) + '/' + str(round(deficit90, 0)) + '   R=' + str(r) + '   RMSE[m]=' + str(RMSE)
-              + '   mPeak error[m]=' + str(mPeak_err) + '  mPeak shift[h]=' + str(mPeak_anti), size=12)
-    plt.plot(df_max.maxOBS.index, df_max.maxOBS.values, "x")
-    plt.plot(df_max.maxEST.index, df_max.maxEST.values, "x")
-    plt.legend()
-    plt.savefig(outputPath + "Prev_" + string_ini + ".png", bbox_inches='tight', dpi=100)
-        
+
     # write csv out with level, whc, infiltration
-    df_max.to_csv(outputPath + "Max_" + string_ini + ".csv")
-    df.to_csv(outputPath + "Data_" + string_ini + ".csv", columns=[precName,'WHC90','swc','estLevel','Livello'])
+    eventStore.writeTable(df_max, outputPath + "Max_" + string_ini, tableFormat)
+    eventStore.writeTable(df[[precName,'WHC90','swc','estLevel','Livello']], outputPath + "Data_" + string_ini,
+                          tableFormat)
+
+    title = ('WHCini 35/90=' + str(round(deficit35, 0)) + '/' + str(round(deficit90, 0)) + '   R=' + str(r)
+             + '   RMSE[m]=' + str(RMSE) + '   mPeak error[m]=' + str(mPeak_err) + '  mPeak shift[h]=' + str(mPeak_anti))
+    maxObs = df_max.maxOBS.dropna()
+    maxEst = df_max.maxEST.dropna()
+    plotJob = rendering.makeJob('event', outputFileName=outputPath + "Prev_" + string_ini + "." + figureFormat,
+                                dates=xo, observed=vobs, estimated=vest,
+                                peaksObs=(maxObs.index, maxObs.values), peaksEst=(maxEst.index, maxEst.values),
+                                title=title, levelLimits=settings['levelLimits'])
+    return val_evento, plotJob
+
+
+# validation of one event with its figure: returns the row of scores (None for events without runoff)
+def validateEvent(settings, fileName, plots=True, useStore=False, tableFormat='csv', figureFormat='png'):
+    val_evento, plotJob = evaluateEvent(settings, fileName, useStore, tableFormat, figureFormat)
+    if plots:
+        rendering.render(plotJob)
+    return val_evento
+
+
+# validation of all events, in parallel on nrWorkers processes
+# the scores are collected in the order of fileNames
+# deferPlots: the figures are rendered after all the events (in parallel), instead of by each event
+def runValidation(settings, fileNames, nrWorkers=1, plots=True, useStore=False, deferPlots=False,
+                  tableFormat='csv', figureFormat='png'):
+    nrEvents = len(fileNames)
+    storeFlags = [useStore] * nrEvents
+    if useStore:
+        # build or refresh the store once, before the workers read it
+        eventStore.loadEventStore(settings['name'])
+    formats = ([tableFormat] * nrEvents, [figureFormat] * nrEvents)
+    if deferPlots:
+        function, arguments = evaluateEvent, ([settings] * nrEvents, fileNames, storeFlags) + formats
+    else:
+        function, arguments = validateEvent, ([settings] * nrEvents, fileNames, [plots] * nrEvents,
+                                              storeFlags) + formats
+    if nrWorkers > 1:
+        with ProcessPoolExecutor(max_workers=nrWorkers) as executor:
+            results = list(executor.map(function, *arguments))
+    else:
+        results = list(map(function, *arguments))
+
+    if deferPlots:
+        if plots:
+            rendering.renderJobs([plotJob for _, plotJob in results], nrWorkers)
+        results = [val_evento for val_evento, _ in results]
+
+    list_scores = [val_evento for val_evento in results if val_evento is not None]
+    return pd.DataFrame(list_scores, columns=["date", "DEFICIT35", "R", "R_SHIFT", "RMSE", "mP_error", "mP_ant"])
+
+
+# command line arguments of the validation (also used by the validate command of creek.py)
+def addArguments(parser):
+    parser.add_argument('--basin', default=DEFAULT_BASIN, help="basin name in basins.json (e.g. QUADERNA)")
+    parser.add_argument('events', nargs='*', help="event files or glob patterns (default: all the events of the basin)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of parallel processes")
+    parser.add_argument('--no-plots', dest='plots', action='store_false', help="skip figure generation")
+    parser.add_argument('--defer-plots', action='store_true', help="render the figures after all the events")
+    parser.add_argument('--store', action='store_true', help="read the events from the binary event store")
+    parser.add_argument('--format', default='csv', choices=eventStore.TABLE_FORMATS, help="format of the tables")
+    parser.add_argument('--figure-format', default='png', help="format of the figures (e.g. png, pdf, svg)")
+
+
+def runCommand(args):
+    settings = basins.getBasin(args.basin)
+    fileNames = basins.getEventFiles(settings, args.events)
+    df_out = runValidation(settings, fileNames, max(args.workers, 1), args.plots, args.store, args.defer_plots,
+                           args.format, args.figure_format)
+    outputFileName = eventStore.writeTable(df_out, settings['outputPath'] + "stat_tests", args.format)
+    print(df_out.describe())
+    print("Events: ", len(fileNames), "\tOutput file: ", outputFileName)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Criteria-Rainbo validation on observed events")
+    addArguments(parser)
+    runCommand(parser.parse_args())
+
 
-df_out = pd.DataFrame(list_scores, columns=["date", "DEFICIT35", "R", "R_SHIFT", "RMSE", "mP_error", "mP_ant"])
-df_out.to_csv(outputPath + "stat_tests.csv")  # salva su csv
-print(df_out.describe())
+if __name__ == '__main__':
+    main()